@@ -1 +1,4 @@
-from .gui import open_interface
+def open_interface():
+    # PyQt5 is only imported when the interface is opened, the editor core works headless
+    from video_editor.gui import open_interface
+    return open_interface()
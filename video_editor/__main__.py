@@ -0,0 +1,4 @@
+from video_editor.cli import main
+
+if __name__ == '__main__':
+    main()
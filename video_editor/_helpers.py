@@ -1,27 +1,224 @@
 from subprocess import Popen, PIPE
+from functools import lru_cache
+from collections import deque
 import shlex
 import pathlib
+import signal
+import threading
+import os
 
+FFMPEG_ENV_VAR = "VIDEO_EDITOR_FFMPEG"
+FFPROBE_ENV_VAR = "VIDEO_EDITOR_FFPROBE"
+STDERR_MAX_LINES = 200
+CANCEL_POLL_INTERVAL = 0.2
 
-def run_command(command_line, shell=False):
-    proc = Popen(shlex.split(command_line), stdout=PIPE, stderr=PIPE, shell=shell)
-    out, err = proc.communicate()
+_ffmpeg_override = None
+
+
+def kill_process(proc):
+    # ffmpeg runs in its own process group so any child it spawns is killed too
+    if os.name == 'nt':
+        proc.kill()
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def parse_progress(lines):
+    # Turns a "-progress" block of key=value lines into an event
+    values = dict(line.split("=", 1) for line in lines if "=" in line)
+    out_time = values.get('out_time_us', values.get('out_time_ms', ''))
+    speed = values.get('speed', '').rstrip('x')
+    return {
+        'frame': int(values['frame']) if values.get('frame', '').isdigit() else None,
+        'fps': float(values['fps']) if values.get('fps', '').replace('.', '', 1).isdigit() else None,
+        'out_time': int(out_time) / 1e6 if out_time.isdigit() else None,
+        'speed': float(speed) if speed.replace('.', '', 1).isdigit() else None,
+        'finished': values.get('progress') == 'end',
+    }
+
+
+def wait_process(proc, usage=None):
+    # wait4 also gives the resources used by the process, where available
+    if usage is None or not hasattr(os, 'wait4'):
+        return proc.wait()
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Already reaped by Popen
+        return proc.wait()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    usage['cpu_time'] = rusage.ru_utime + rusage.ru_stime
+    usage['max_rss'] = rusage.ru_maxrss
+    return proc.returncode
+
+
+def run_command(command_line, shell=False, progress=None, cancel=None, stderr_callback=None, usage=None):
+    args = shlex.split(command_line)
+    if progress is not None:
+        args[1:1] = ['-progress', 'pipe:1', '-nostats']
+
+    proc = Popen(args, stdout=PIPE, stderr=PIPE, shell=shell, start_new_session=(os.name != 'nt'),
+                 universal_newlines=True, errors='replace')
+    cancelled = threading.Event()
+    reaping = threading.Event()
+
+    # Only the tail of stderr is kept, it's enough to explain a failure
+    err = deque(maxlen=STDERR_MAX_LINES)
+
+    def read_stderr():
+        for line in proc.stderr:
+            err.append(line)
+            if stderr_callback is not None:
+                stderr_callback(line.rstrip("\n"))
+
+    def watch_cancel():
+        # Doesn't poll the process, only the main thread reaps it and this one stops before
+        while not reaping.wait(CANCEL_POLL_INTERVAL):
+            if cancel.is_set():
+                cancelled.set()
+                kill_process(proc)
+                return
+
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+    watcher = threading.Thread(target=watch_cancel, daemon=True)
+    if cancel is not None:
+        watcher.start()
+
+    out, block = [], []
+    for line in proc.stdout:
+        if progress is None:
+            out.append(line)
+            continue
+        line = line.strip()
+        block.append(line)
+        if line.startswith("progress="):
+            progress(parse_progress(block))
+            block = []
+
+    # Once reaped its pid may be reused, the process must not be killed after that
+    reaping.set()
+    if watcher.is_alive():
+        watcher.join()
+    wait_process(proc, usage)
+    stderr_thread.join()
     proc.stderr.close()
     proc.stdout.close()
+    if cancelled.is_set():
+        return False, "Cancelled"
+    if usage is not None:
+        usage['returncode'] = proc.returncode
     if proc.returncode:
-        return False, err.decode('utf8')
-    return True, out.decode('utf8')
+        return False, "".join(err)
+    return True, "".join(out)
+
+
+def run_pipeline(command_lines, progress=None, cancel=None, usage=None):
+    """
+    Runs the commands at once, the stdout of each one feeding the stdin of the next. Only the
+    last one can report progress, the others write their output to the pipe. Returns a
+    (success, output) tuple like run_command, with the stderr tail of every failed command.
+    usage gets the summed CPU time and peak memory of the processes, they run together.
+    """
+    procs, errs = [], []
+    for i, command_line in enumerate(command_lines):
+        args = shlex.split(command_line)
+        if progress is not None and i == len(command_lines) - 1:
+            args[1:1] = ['-progress', 'pipe:1', '-nostats']
+        proc = Popen(args, stdin=procs[-1].stdout if procs else None, stdout=PIPE, stderr=PIPE,
+                     start_new_session=(os.name != 'nt'))
+        if procs:
+            # Only the next process holds the pipe, so it sees a broken pipe if this one dies
+            procs[-1].stdout.close()
+        procs.append(proc)
+        errs.append(deque(maxlen=STDERR_MAX_LINES))
+    cancelled = threading.Event()
+    reaping = threading.Event()
+
+    def read_stderr(proc, err):
+        for line in proc.stderr:
+            err.append(line.decode(errors='replace'))
+
+    def watch_cancel():
+        # Same as in run_command, stops before any process is reaped
+        while not reaping.wait(CANCEL_POLL_INTERVAL):
+            if cancel.is_set():
+                cancelled.set()
+                for proc in procs:
+                    kill_process(proc)
+                return
+
+    stderr_threads = [threading.Thread(target=read_stderr, args=(proc, err), daemon=True)
+                      for proc, err in zip(procs, errs)]
+    for thread in stderr_threads:
+        thread.start()
+    watcher = threading.Thread(target=watch_cancel, daemon=True)
+    if cancel is not None:
+        watcher.start()
+
+    out, block = [], []
+    for line in procs[-1].stdout:
+        line = line.decode(errors='replace')
+        if progress is None:
+            out.append(line)
+            continue
+        line = line.strip()
+        block.append(line)
+        if line.startswith("progress="):
+            progress(parse_progress(block))
+            block = []
+
+    reaping.set()
+    if watcher.is_alive():
+        watcher.join()
+    usages = [dict() if usage is not None else None for _ in procs]
+    for proc, thread, proc_usage in zip(procs, stderr_threads, usages):
+        wait_process(proc, proc_usage)
+        thread.join()
+        proc.stderr.close()
+    if usage is not None:
+        for key in ('cpu_time', 'max_rss'):
+            if any(key in proc_usage for proc_usage in usages):
+                usage[key] = sum(proc_usage.get(key, 0) for proc_usage in usages)
+    procs[-1].stdout.close()
+    if cancelled.is_set():
+        return False, "Cancelled"
+
+    # A failure usually makes its neighbours fail too, every failed command is reported
+    failed = [i for i, proc in enumerate(procs) if proc.returncode]
+    if failed:
+        return False, "".join("[{}] {}\n{}".format(i + 1, command_lines[i], "".join(errs[i])) for i in failed)
+    return True, "".join(out)
 
 
+def set_ffmpeg_binary(binary):
+    # Explicit override, takes precedence over the environment variable and the lookup
+    global _ffmpeg_override
+    _ffmpeg_override = binary
+    get_ffmpeg_binary.cache_clear()
+    get_ffprobe_binary.cache_clear()
+    get_ffmpeg_capabilities.cache_clear()
+    get_ffmpeg_version.cache_clear()
+
+
+@lru_cache(maxsize=None)
 def get_ffmpeg_binary():
     def try_command(cmd):
         try:
-            run_command(cmd)
+            run_command("{} -version".format(cmd))
         except FileNotFoundError:
             return False
         else:
             return True
 
+    if _ffmpeg_override:
+        return _ffmpeg_override
+    if os.environ.get(FFMPEG_ENV_VAR):
+        return os.environ[FFMPEG_ENV_VAR]
+
     cmds = [
         "ffmpeg",
         "./ffmpeg",
@@ -32,3 +229,79 @@ def get_ffmpeg_binary():
         if try_command(cmd):
             return cmd
     raise SystemError("FFMPEG not found")
+
+
+@lru_cache(maxsize=None)
+def get_ffprobe_binary():
+    # ffprobe ships next to ffmpeg in every distribution we support
+    if os.environ.get(FFPROBE_ENV_VAR):
+        return os.environ[FFPROBE_ENV_VAR]
+    ffmpeg = get_ffmpeg_binary()
+    head, sep, tail = ffmpeg.rpartition("ffmpeg")
+    return head + "ffprobe" + tail if sep else "ffprobe"
+
+
+def get_file_identity(path):
+    stat = os.stat(path)
+    return os.path.abspath(path).replace("\\", "/"), stat.st_size, stat.st_mtime_ns
+
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_version():
+    succ, out = run_command("{} -version".format(get_ffmpeg_binary()))
+    if not succ or not out.startswith("ffmpeg version"):
+        return "unknown"
+    return out.split()[2]
+
+
+def _parse_codec_listing(output):
+    # Entries come after the " ------" separator, e.g. " V..... libx264  libx264 H.264 ..."
+    names = set()
+    listing = False
+    for line in output.splitlines():
+        if line.strip().startswith("------"):
+            listing = True
+        elif listing and line.strip():
+            names.add(line.split()[1])
+    return names
+
+
+def _parse_filter_listing(output):
+    # Entries look like " TSC scdet  V->V  Detect video scene change"
+    names = set()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and "->" in fields[2]:
+            names.add(fields[1])
+    return names
+
+
+def _parse_hwaccel_listing(output):
+    lines = [line.strip() for line in output.splitlines()]
+    return set(line for line in lines if line and not line.endswith(":"))
+
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_capabilities():
+    capabilities = dict()
+    parsers = [
+        ('encoders', '-encoders', _parse_codec_listing),
+        ('filters', '-filters', _parse_filter_listing),
+        ('hwaccels', '-hwaccels', _parse_hwaccel_listing),
+    ]
+    for key, flag, parser in parsers:
+        succ, out = run_command("{} -hide_banner {}".format(get_ffmpeg_binary(), flag))
+        capabilities[key] = frozenset(parser(out) if succ else ())
+    return capabilities
+
+
+def has_encoder(name):
+    return name in get_ffmpeg_capabilities()['encoders']
+
+
+def has_filter(name):
+    return name in get_ffmpeg_capabilities()['filters']
+
+
+def has_hwaccel(name):
+    return name in get_ffmpeg_capabilities()['hwaccels']
@@ -1,6 +1,34 @@
 from video_editor._helpers import get_ffmpeg_binary, run_command
+from video_editor.aio import run_command_async
+from video_editor.profiles import get_profile_args
+from video_editor.speed import SpeedCurve
+from video_editor import trace
 from abc import ABC, abstractmethod
-from math import log2, floor
+
+
+# Seek strategies: 'input' seeks before decoding (fast, keyframe accurate when copying), 'output'
+# decodes from the start and drops frames (accurate, slow), 'hybrid' seeks to the keyframe before
+# the cut and drops the few decoded frames up to it (accurate, fast)
+SEEK_MODES = ('input', 'output', 'hybrid')
+
+# Stream copied cuts seek this far (ms) past their start, so the keyframe they start at is
+# found even if its probed time was rounded up
+COPY_SEEK_MARGIN = 1
+
+
+def get_seek_args(start_time, end_time, seek='input', keyframes=None, factor=1):
+    # Returns the (input, output) options selecting the interval, output ones are in output time
+    duration = (end_time - start_time) / 1000
+    if seek == 'output':
+        return "", "-ss {:.3f} -t {:.3f}".format(start_time / 1000 / factor, duration / factor)
+
+    keyframe = keyframes.previous_keyframe(start_time) if seek == 'hybrid' and keyframes else None
+    if keyframe is None or start_time - keyframe < 1:
+        return "-ss {:.3f} -t {:.3f}".format(start_time / 1000, duration), ""
+
+    preroll = (start_time - keyframe) / 1000
+    return ("-ss {:.3f} -t {:.3f}".format(keyframe / 1000, preroll + duration),
+            "-ss {:.3f}".format(preroll / factor))
 
 
 class BaseAction(ABC):
@@ -8,44 +36,105 @@ class BaseAction(ABC):
     def __init__(self, input_path, output_path):
         self.input = input_path
         self.output = output_path
+        self.threads = None
+        # Needed when writing to a pipe, there's no extension to guess the format from
+        self.output_format = None
+
+    @property
+    def threads_arg(self):
+        return "-threads {}".format(self.threads) if self.threads else ""
+
+    @property
+    def format_arg(self):
+        return "-f {}".format(self.output_format) if self.output_format else ""
 
     @abstractmethod
-    def run(self):
+    def get_command(self):
         pass
 
+    @property
+    def stage(self):
+        return type(self).__name__
+
+    def run(self, progress=None, cancel=None):
+        command = self.get_command()
+        with trace.span(self.stage, command, self.input, self.output) as event:
+            succ, msg = run_command(command, progress=progress, cancel=cancel, usage=event)
+            event['success'] = succ
+        return succ, msg
+
+    async def run_async(self, progress=None, timeout=None):
+        command = self.get_command()
+        with trace.span(self.stage, command, self.input, self.output) as event:
+            succ, msg = await run_command_async(command, progress=progress, timeout=timeout, usage=event)
+            event['success'] = succ
+        return succ, msg
+
 
 class CutAction(BaseAction):
 
-    def __init__(self, input_path, output_path, start_time, end_time, reencode=False):
+    def __init__(self, input_path, output_path, start_time, end_time, reencode=False, video_codec=None,
+                 seek='input', keyframes=None, encoder_args=None):
         super().__init__(input_path, output_path)
         self.reencode = reencode
+        self.video_codec = video_codec
+        # Extra options of video_codec, e.g. to match the profile of copied segments
+        self.encoder_args = encoder_args or []
         self.start_time = start_time
         self.end_time = end_time
-
-    def run(self):
-        cmd = '{ffmpeg} -y -ss {s:.2f} -t {d:.2f} -i "{fn}" -async 1 {re} "{o}"'.format(
+        self.seek = seek
+        self.keyframes = keyframes
+
+    @property
+    def codec_args(self):
+        if not self.reencode:
+            return "-c copy"
+        if self.video_codec:
+            # Only the video is reencoded, audio frames can be cut anywhere
+            return " ".join(["-c:v {}".format(self.video_codec)] + self.encoder_args + ["-c:a copy"])
+        return ""
+
+    def get_command(self):
+        if self.reencode:
+            input_seek, output_seek = get_seek_args(self.start_time, self.end_time, self.seek, self.keyframes)
+        else:
+            # Copied streams start at the keyframe at or before the seek point, the end stays exact
+            start_time = self.start_time + COPY_SEEK_MARGIN
+            input_seek, output_seek = "-ss {:.6f} -t {:.6f}".format(
+                start_time / 1000, (self.end_time - start_time) / 1000), ""
+        return '{ffmpeg} -y {ss} -i "{fn}" {oss} -async 1 {re} {th} {fmt} "{o}"'.format(
             ffmpeg=get_ffmpeg_binary(),
             fn=self.input,
-            s=self.start_time/1000,
-            d=(self.end_time-self.start_time)/1000,
-            re="" if self.reencode else "-c copy",
+            ss=input_seek,
+            oss=output_seek,
+            re=self.codec_args,
+            th=self.threads_arg,
+            fmt=self.format_arg,
             o=self.output,
         )
-        return run_command(cmd)
 
 
 class CompressAction(BaseAction):
 
-    def __init__(self, input_path, output_path):
+    def __init__(self, input_path, output_path, profile=None):
         super().__init__(input_path, output_path)
+        self.profile = profile
 
-    def run(self):
-        cmd = '{ffmpeg} -y -i "{fn}" -vcodec h264 -acodec aac "{o}"'.format(
+    @property
+    def codec_args(self):
+        if self.profile:
+            return " ".join(get_profile_args(self.profile))
+        return "-vcodec h264 -acodec aac"
+
+    def get_command(self):
+        return '{ffmpeg} -y -i "{fn}" {codec} {th} {fmt} "{o}"'.format(
             ffmpeg=get_ffmpeg_binary(),
             fn=self.input,
+            codec=self.codec_args,
+            th=self.threads_arg,
+            fmt=self.format_arg,
             o=self.output,
         )
-        return run_command(cmd)
 
 
 class RemoveAudioAction(BaseAction):
@@ -53,36 +142,38 @@ class RemoveAudioAction(BaseAction):
     def __init__(self, input_path, output_path):
         super().__init__(input_path, output_path)
 
-    def run(self):
-        cmd = '{ffmpeg} -y -i "{fn}" -c:v copy -af volume=0 "{o}"'.format(
+    def get_command(self):
+        return '{ffmpeg} -y -i "{fn}" -c:v copy -af volume=0 {th} {fmt} "{o}"'.format(
             ffmpeg=get_ffmpeg_binary(),
             fn=self.input,
+            th=self.threads_arg,
+            fmt=self.format_arg,
             o=self.output,
         )
-        return run_command(cmd)
 
 
 class SpeedupAction(BaseAction):
 
-    def __init__(self, input_path, output_path, speed_factor, drop_frames=True):
+    def __init__(self, input_path, output_path, speed_factor, drop_frames=True, has_audio=True, curve=None):
         super().__init__(input_path, output_path)
         self.factor = speed_factor
         self.drop_frames = drop_frames
+        self.has_audio = has_audio
+        self.curve = curve or SpeedCurve([(0, speed_factor)])
 
     def get_complex_filter(self):
-        rep = floor(log2(self.factor))
-        additional = round(self.factor / (2 ** rep), 2)
-        atempo_filters = ["atempo=2.0"] * rep + ["atempo={}".format(additional)]
-        return '[0:v]setpts=PTS/{factor}[v];[0:a]{atempo}[a]'.format(
-            factor=self.factor,
-            atempo=",".join(atempo_filters),
-        )
+        complex_filter = '[0:v]{setpts}[v]'.format(setpts=self.curve.get_video_filter())
+        if self.has_audio:
+            complex_filter += ';[0:a]{atempo}[a]'.format(atempo=self.curve.get_audio_filter())
+        return complex_filter
 
-    def run(self):
-        cmd = '{ffmpeg} -y -i "{fn}" -filter_complex "{filter}" -map "[v]" -map "[a]" "{o}"'.format(
+    def get_command(self):
+        return '{ffmpeg} -y -i "{fn}" -filter_complex "{filter}" {maps} {th} {fmt} "{o}"'.format(
             ffmpeg=get_ffmpeg_binary(),
             fn=self.input,
             filter=self.get_complex_filter(),
+            maps='-map "[v]" -map "[a]"' if self.has_audio else '-map "[v]"',
+            th=self.threads_arg,
+            fmt=self.format_arg,
             o=self.output,
         )
-        return run_command(cmd)
@@ -0,0 +1,86 @@
+from video_editor._helpers import STDERR_MAX_LINES, kill_process, parse_progress
+from video_editor.scheduler import get_default_workers
+from asyncio.subprocess import PIPE
+from collections import deque
+from functools import partial
+from weakref import WeakKeyDictionary
+import asyncio
+import os
+import shlex
+
+_max_processes = None
+_semaphores = WeakKeyDictionary()
+
+
+def set_max_processes(count):
+    # Limit of ffmpeg processes running at once, shared by every coroutine of an event loop
+    global _max_processes
+    _max_processes = count
+    _semaphores.clear()
+
+
+def get_semaphore():
+    # Semaphores are bound to a loop, each loop gets its own with the same limit
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(_max_processes or get_default_workers())
+    return _semaphores[loop]
+
+
+async def run_in_thread(func, *args, **kwargs):
+    # For the blocking bits (probing, cache bookkeeping), they are cached and short
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+
+async def run_command_async(command_line, progress=None, timeout=None, stderr_callback=None, usage=None):
+    """
+    Asyncio counterpart of run_command, returning the same (success, output) tuple. It waits
+    for a free process slot first. timeout (seconds) only counts while the process runs.
+    The process is killed on timeout, or when the awaiting task is cancelled, in which case
+    the cancellation is raised again.
+    """
+    args = shlex.split(command_line)
+    if progress is not None:
+        args[1:1] = ['-progress', 'pipe:1', '-nostats']
+
+    async with get_semaphore():
+        proc = await asyncio.create_subprocess_exec(*args, stdout=PIPE, stderr=PIPE,
+                                                    start_new_session=(os.name != 'nt'))
+        out, err = [], deque(maxlen=STDERR_MAX_LINES)
+
+        async def read_stderr():
+            async for line in proc.stderr:
+                line = line.decode(errors='replace')
+                err.append(line)
+                if stderr_callback is not None:
+                    stderr_callback(line.rstrip("\r\n"))
+
+        async def read_stdout():
+            block = []
+            async for line in proc.stdout:
+                line = line.decode(errors='replace')
+                if progress is None:
+                    out.append(line)
+                    continue
+                line = line.strip()
+                block.append(line)
+                if line.startswith("progress="):
+                    progress(parse_progress(block))
+                    block = []
+
+        try:
+            await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr(), proc.wait()), timeout)
+        except asyncio.TimeoutError:
+            kill_process(proc)
+            await proc.wait()
+            return False, "Timed out after {}s".format(timeout)
+        except asyncio.CancelledError:
+            kill_process(proc)
+            await proc.wait()
+            raise
+
+    if usage is not None:
+        usage['returncode'] = proc.returncode
+    if proc.returncode:
+        return False, "".join(err)
+    return True, "".join(out)
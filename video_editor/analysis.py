@@ -0,0 +1,118 @@
+from video_editor._helpers import get_ffmpeg_binary, has_filter, run_command
+from video_editor.probe import get_media_info, get_probe_index
+import re
+
+SCDET_PATTERN = re.compile(r"lavfi\.scd\.score:\s*([\d.]+),\s*lavfi\.scd\.time:\s*([\d.]+)")
+METADATA_FRAME_PATTERN = re.compile(r"pts_time:([\d.]+)")
+SCENE_SCORE_PATTERN = re.compile(r"lavfi\.scene_score=([\d.]+)")
+SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+SILENCE_END_PATTERN = re.compile(r"silence_end:\s*([\d.]+)")
+
+# Scene detection runs on a downscaled copy, scores barely change and decoding is the bottleneck
+ANALYSIS_WIDTH = 320
+
+
+class SplitDetector:
+
+    """
+    Finds split points in a single pass over the source: scene changes in the video and
+    the middle of silences in the audio. Events are parsed from ffmpeg's log as it runs.
+    Set a threshold to None to disable that detector.
+    """
+
+    def __init__(self, video_path, scene_threshold=0.3, silence_noise=-30, silence_duration=0.5,
+                 min_split_length=1000):
+        self.video_path = video_path
+        self.scene_threshold = scene_threshold
+        self.silence_noise = silence_noise
+        self.silence_duration = silence_duration
+        self.min_split_length = min_split_length
+        self.points = []
+        self.silence_start = None
+        self.frame_time = None
+
+    @property
+    def parameters(self):
+        return [self.scene_threshold, self.silence_noise, self.silence_duration, self.min_split_length]
+
+    def get_video_filters(self):
+        filters = ["scale={}:-2".format(ANALYSIS_WIDTH)]
+        if has_filter('scdet'):
+            filters.append("scdet=threshold={}".format(self.scene_threshold * 100))
+        else:
+            # Older ffmpeg, the scene score is computed by select
+            filters.append("select='gt(scene,{})',metadata=print".format(self.scene_threshold))
+        return filters
+
+    def get_command(self):
+        args = []
+        if self.scene_threshold is not None:
+            args.append('-filter:v "{}"'.format(",".join(self.get_video_filters())))
+        else:
+            args.append("-vn")
+        if self.silence_noise is not None and get_media_info(self.video_path).has_audio:
+            args.append('-filter:a "silencedetect=noise={}dB:duration={}"'.format(self.silence_noise,
+                                                                                  self.silence_duration))
+        else:
+            args.append("-an")
+
+        return '{ffmpeg} -hide_banner -nostats -i "{fn}" {args} -f null -'.format(
+            ffmpeg=get_ffmpeg_binary(),
+            fn=self.video_path,
+            args=" ".join(args),
+        )
+
+    def add_point(self, seconds, on_point):
+        time = round(seconds * 1000)
+        self.points.append(time)
+        if on_point is not None:
+            on_point(time)
+
+    def parse_line(self, line, on_point=None):
+        match = SCDET_PATTERN.search(line)
+        if match:
+            return self.add_point(float(match.group(2)), on_point)
+
+        match = METADATA_FRAME_PATTERN.search(line)
+        if match:
+            self.frame_time = float(match.group(1))
+            return
+        match = SCENE_SCORE_PATTERN.search(line)
+        if match and self.frame_time is not None:
+            return self.add_point(self.frame_time, on_point)
+
+        match = SILENCE_START_PATTERN.search(line)
+        if match:
+            self.silence_start = max(0.0, float(match.group(1)))
+            return
+        match = SILENCE_END_PATTERN.search(line)
+        if match and self.silence_start is not None:
+            self.add_point((self.silence_start + float(match.group(1))) / 2, on_point)
+            self.silence_start = None
+
+    def filter_points(self, points):
+        duration = get_media_info(self.video_path).duration
+        filtered = []
+        for time in sorted(points):
+            if time < self.min_split_length or time > duration - self.min_split_length:
+                continue
+            if filtered and time - filtered[-1] < self.min_split_length:
+                continue
+            filtered.append(time)
+        return filtered
+
+    def detect(self, on_point=None, progress=None, cancel=None):
+        # Returns (success, split points in ms), cached per source and parameters
+        cached = get_probe_index().get('splitpoints', self.video_path, *self.parameters)
+        if cached is not None:
+            return True, cached
+
+        self.points = []
+        succ, msg = run_command(self.get_command(), progress=progress, cancel=cancel,
+                                stderr_callback=lambda line: self.parse_line(line, on_point))
+        if not succ:
+            return False, msg
+
+        points = self.filter_points(self.points)
+        get_probe_index().put('splitpoints', self.video_path, points, *self.parameters)
+        return True, points
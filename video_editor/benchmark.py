@@ -0,0 +1,234 @@
+from video_editor._helpers import get_ffmpeg_binary, get_ffmpeg_version, run_command
+from video_editor.actions import SEEK_MODES, CutAction
+from video_editor.editor import VideoEditor
+from video_editor.keyframes import get_keyframe_index
+from video_editor import trace
+import json
+import os
+import tempfile
+import threading
+import time
+
+SOURCES = [
+    {'width': 640, 'height': 360, 'duration': 30, 'gop': 30},
+    {'width': 1280, 'height': 720, 'duration': 60, 'gop': 60},
+    {'width': 1920, 'height': 1080, 'duration': 60, 'gop': 250},
+]
+
+QUICK_SOURCES = SOURCES[:1]
+
+SPLIT_COUNTS = [1, 4, 16]
+
+CONFIGS = {
+    'cut': {},
+    'compress': {'compress': True},
+    'removeaudio': {'removeaudio': True},
+    'speedup': {'speedup': {'factor': 2, 'dropframes': True}},
+}
+
+OPERATIONS = ['export', 'join']
+
+FRAME_RATE = 30
+
+# Cut points (ms) of the seek benchmark, most of them between keyframes
+SEEK_CUTS = [(1033, 4000), (12366, 15000), (27700, 29000)]
+
+# Output frames compared against the source around the expected one
+SEEK_SEARCH_FRAMES = 2
+
+
+def generate_source(dir_path, width, height, duration, gop):
+    output = "{}/testsrc_{}x{}_{}s_g{}.mp4".format(dir_path, width, height, duration, gop)
+    cmd = '{ffmpeg} -y -f lavfi -i testsrc2=size={w}x{h}:rate={r}:duration={d} ' \
+          '-f lavfi -i sine=frequency=440:duration={d} -c:v libx264 -g {g} -pix_fmt yuv420p ' \
+          '-c:a aac -shortest "{o}"'.format(ffmpeg=get_ffmpeg_binary(), w=width, h=height, r=FRAME_RATE,
+                                            d=duration, g=gop, o=output)
+    succ, msg = run_command(cmd)
+    if not succ:
+        raise SystemError("Could not generate test source\n{}".format(msg))
+    return output
+
+
+class UsageSink:
+
+    """
+    Trace sink collecting the stages of a case. Each ffmpeg process reports its own CPU
+    time and peak memory (wait4, not available on Windows) and the size of its output,
+    intermediate files included.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def write(self, event):
+        with self.lock:
+            self.events.append(event)
+
+
+def measure(func):
+    sink = UsageSink()
+    trace.add_sink(sink)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        succ, _ = func()
+    finally:
+        trace.remove_sink(sink)
+    wall_time = time.perf_counter() - start
+    return {
+        'success': succ,
+        'wall_time': wall_time,
+        'cpu_time': time.process_time() - cpu_start + sum(event.get('cpu_time', 0) for event in sink.events),
+        # Peak of the largest process of this case, ru_maxrss is in KB on Linux
+        'peak_rss': max([event.get('max_rss', 0) for event in sink.events] + [0]) * 1024,
+        'bytes_written': sum(event.get('output_size') or 0 for event in sink.events),
+    }
+
+
+def build_editor(source, duration, split_count, config):
+    editor = VideoEditor(source, duration * 1000)
+    for i in range(1, split_count):
+        editor.add_split(i * duration * 1000 // split_count)
+    for split_id in range(split_count):
+        editor.update_split(split_id, dict(config))
+    return editor
+
+
+def run_case(editor, operation, dir_path):
+    split_ids = list(range(len(editor.get_splits())))
+
+    def export():
+        outputs = []
+        for split_id in split_ids:
+            output = "{}/split_{}.mp4".format(dir_path, split_id)
+            succ, msg = editor.export_split(split_id, output)
+            if not succ:
+                return False, outputs
+            outputs.append(output)
+        return True, outputs
+
+    def join():
+        output = "{}/joined.mp4".format(dir_path)
+        succ, _ = editor.export_and_join_splits(split_ids, output)
+        return succ, [output]
+
+    return measure(export if operation == 'export' else join)
+
+
+def run_benchmark(sources=SOURCES, split_counts=SPLIT_COUNTS, configs=CONFIGS, operations=OPERATIONS,
+                  mode='fused', log=print):
+    results = []
+    with tempfile.TemporaryDirectory() as dir_path:
+        dir_path = dir_path.replace("\\", "/")
+        for source_spec in sources:
+            source = generate_source(dir_path, **source_spec)
+            for split_count in split_counts:
+                for config_name, config in configs.items():
+                    for operation in operations:
+                        editor = build_editor(source, source_spec['duration'], split_count, config)
+                        editor.export_mode = mode
+                        with tempfile.TemporaryDirectory(dir=dir_path) as case_path:
+                            result = run_case(editor, operation, case_path.replace("\\", "/"))
+                        result.update(source_spec, splits=split_count, config=config_name, operation=operation)
+                        results.append(result)
+                        log("{width}x{height} {duration}s gop={gop} splits={splits} {config} {operation}: "
+                            "{wall_time:.2f}s wall, {cpu_time:.2f}s cpu".format(**result))
+
+    return {
+        'ffmpeg': get_ffmpeg_version(),
+        'mode': mode,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+def get_ssim(video_path, source, time):
+    # Similarity of the first frame of the video with the source frame at time (ms)
+    cmd = '{ffmpeg} -i "{fn}" -ss {t:.3f} -i "{src}" -filter_complex ' \
+          '"[0:v]trim=end_frame=1[a];[1:v]trim=end_frame=1[b];[a][b]ssim=stats_file=-" -f null -'.format(
+              ffmpeg=get_ffmpeg_binary(), fn=video_path, src=source, t=time / 1000)
+    succ, out = run_command(cmd)
+    if not succ:
+        raise SystemError("Could not compare frames\n{}".format(out))
+    for field in out.split():
+        if field.startswith("All:"):
+            return float(field[4:])
+    return 0
+
+
+def get_frame_error(video_path, source, start_time):
+    # Offset in frames between the first frame of the cut and the source frame it should be
+    frame = 1000 / FRAME_RATE
+    offsets = range(-SEEK_SEARCH_FRAMES, SEEK_SEARCH_FRAMES + 1)
+    scores = {offset: get_ssim(video_path, source, max(0, start_time + offset * frame)) for offset in offsets}
+    return max(scores, key=scores.get)
+
+
+def run_seek_benchmark(sources=SOURCES, cuts=SEEK_CUTS, modes=SEEK_MODES, log=print):
+    """
+    Times reencoded cuts with every seek mode and checks they start at the right frame.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as dir_path:
+        dir_path = dir_path.replace("\\", "/")
+        for source_spec in sources:
+            source = generate_source(dir_path, **source_spec)
+            keyframes = get_keyframe_index(source)
+            for start_time, end_time in cuts:
+                if end_time > source_spec['duration'] * 1000:
+                    continue
+                for mode in modes:
+                    output = "{}/cut_{}_{}.mp4".format(dir_path, start_time, mode)
+                    action = CutAction(source, output, start_time, end_time, reencode=True, seek=mode,
+                                       keyframes=keyframes)
+                    result = measure(lambda: (action.run()[0], [output]))
+                    result['frame_error'] = get_frame_error(output, source, start_time) if result['success'] else None
+                    result.update(source_spec, start=start_time, end=end_time, seek=mode)
+                    results.append(result)
+                    log("{width}x{height} gop={gop} cut {start}-{end} {seek}: {wall_time:.2f}s wall, "
+                        "{frame_error} frames off".format(**result))
+
+    return {
+        'ffmpeg': get_ffmpeg_version(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+def get_case_key(result):
+    fields = ('width', 'height', 'duration', 'gop', 'splits', 'config', 'operation')
+    return tuple(result.get(field) for field in fields)
+
+
+def compare(baseline, current, log=print):
+    # Prints the wall time ratio of every case present in both runs
+    baseline_results = {get_case_key(result): result for result in baseline['results']}
+    for result in current['results']:
+        previous = baseline_results.get(get_case_key(result))
+        if previous is None or not previous['wall_time']:
+            continue
+        log("{} {:.2f}s -> {:.2f}s ({:+.1%})".format(
+            " ".join(str(field) for field in get_case_key(result)), previous['wall_time'], result['wall_time'],
+            result['wall_time'] / previous['wall_time'] - 1))
+
+
+def main(args):
+    sources = QUICK_SOURCES if args.quick else SOURCES
+    if args.seek:
+        report = run_seek_benchmark(sources=sources)
+        if args.output:
+            with open(args.output, "wt") as output_file:
+                json.dump(report, output_file, indent=2)
+        # Hybrid seeking has to be as accurate as decoding from the start
+        return 0 if all(result['success'] and (result['seek'] != 'hybrid' or result['frame_error'] == 0)
+                        for result in report['results']) else 1
+
+    report = run_benchmark(sources=sources, mode=args.mode)
+    if args.output:
+        with open(args.output, "wt") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "rt") as baseline_file:
+            compare(json.load(baseline_file), report)
+    return 0 if all(result['success'] for result in report['results']) else 1
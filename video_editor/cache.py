@@ -0,0 +1,122 @@
+from video_editor._helpers import get_ffmpeg_version, get_file_identity
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+
+CACHE_DIR_ENV_VAR = "VIDEO_EDITOR_CACHE_DIR"
+DEFAULT_CACHE_SIZE = 10 * 1024 ** 3
+
+
+def get_default_cache_dir(name):
+    base = os.environ.get(CACHE_DIR_ENV_VAR) or str(pathlib.Path.home() / ".cache" / "video_editor")
+    return "{}/{}".format(base.replace("\\", "/"), name)
+
+
+def normalize_config(config):
+    # Disabled options render the same as missing ones
+    return {key: value for key, value in config.items() if value}
+
+
+def evict_lru(directory, max_size, keep=()):
+    # Least recently used files are deleted first, usage is tracked with mtime
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.startswith("."):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+class RenderCache:
+
+    """
+    Content addressed storage of rendered splits, keyed by source identity, split
+    interval, normalized config, export options and ffmpeg version.
+    Paths returned by get and commit are pinned, eviction skips them until they're
+    released, e.g. once the splits of an export are joined.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory or get_default_cache_dir("renders")
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # Reference count of the pinned paths
+        self.pinned = dict()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(video_path, start_time, end_time, config, **options):
+        data = {
+            'source': get_file_identity(video_path),
+            'start': start_time,
+            'end': end_time,
+            'config': normalize_config(config),
+            'options': options,
+            'ffmpeg': get_ffmpeg_version(),
+        }
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf8')).hexdigest()
+
+    def get_path(self, key, extension):
+        return "{}/{}.{}".format(self.directory, key, extension)
+
+    def get(self, key, extension):
+        path = self.get_path(key, extension)
+        with self.lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            self.pin(path)
+        return path
+
+    def contains(self, key, extension):
+        # Unlike get, neither pins the file nor counts as a use
+        return os.path.exists(self.get_path(key, extension))
+
+    def pin(self, path):
+        # Called with the lock held
+        self.pinned[path] = self.pinned.get(path, 0) + 1
+
+    def release(self, *paths):
+        with self.lock:
+            for path in paths:
+                count = self.pinned.get(path, 0) - 1
+                if count > 0:
+                    self.pinned[path] = count
+                else:
+                    self.pinned.pop(path, None)
+            evict_lru(self.directory, self.max_size, keep=set(self.pinned))
+
+    def reserve(self, extension):
+        # Temp files are hidden from eviction until committed
+        fd, path = tempfile.mkstemp(prefix=".", suffix="." + extension, dir=self.directory)
+        os.close(fd)
+        return path.replace("\\", "/")
+
+    def commit(self, tmp_path, key, extension):
+        path = self.get_path(key, extension)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.pin(path)
+            evict_lru(self.directory, self.max_size, keep=set(self.pinned))
+        return path
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
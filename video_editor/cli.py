@@ -0,0 +1,243 @@
+"""
+Example edit decision list, times in milliseconds
+{
+  "source": "input.mp4",
+  "output": "output.mp4",
+  "splits": [15000, 42000],
+  "configs": {
+    "1": {"compress": true, "speedup": {"factor": 2}}
+  },
+  "selected": [0, 1]
+}
+
+Split points can also be detected, any SplitDetector argument is accepted
+  "autosplit": {"scene_threshold": 0.4, "silence_noise": -35}
+"""
+
+from video_editor.analysis import SplitDetector
+from video_editor.cache import CACHE_DIR_ENV_VAR, DEFAULT_CACHE_SIZE, RenderCache
+from video_editor.distributed import DistributedScheduler, FileQueueTransport, LocalWorkerPool, Worker
+from video_editor.editor import VideoEditor
+from video_editor.probe import get_media_info
+from video_editor.project import PROJECT_EXTENSION, load_project
+from video_editor.renderqueue import GUI_STORE, JobStore, RenderQueue
+from video_editor.resources import ResourcePlanner, parse_size
+from video_editor import trace
+import argparse
+import json
+import os
+import signal
+import sys
+
+
+def load_edl(path):
+    with open(path, "rt") as edl_file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("PyYAML is required to read YAML edit decision lists")
+            return yaml.safe_load(edl_file)
+        return json.load(edl_file)
+
+
+def build_editor(edl):
+    duration = edl.get('duration')
+    if duration is None:
+        duration = get_media_info(edl['source']).duration
+
+    editor = VideoEditor(edl['source'], duration)
+    for time in sorted(edl.get('splits', [])):
+        editor.add_split(time)
+    if edl.get('autosplit') is not None:
+        succ, points = SplitDetector(edl['source'], **edl['autosplit']).detect()
+        if not succ:
+            raise SystemExit("Split detection failed\n{}".format(points))
+        editor.add_splits(points)
+    for split_id, config in edl.get('configs', dict()).items():
+        editor.update_split(int(split_id), config)
+    return editor
+
+
+def load_input(path, output=None):
+    # Returns the editor, the selected split ids and the output file of an EDL or project
+    if path.endswith(PROJECT_EXTENSION):
+        try:
+            editor, selected = load_project(path)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    else:
+        edl = load_edl(path)
+        editor = build_editor(edl)
+        selected = edl.get('selected', list(range(len(editor.get_splits()))))
+        output = output or edl.get('output')
+
+    if not output:
+        raise SystemExit("No output file given")
+    return editor, selected, output
+
+
+def export(args):
+    editor, split_ids, output = load_input(args.edl, args.output)
+    editor.export_mode = args.mode
+    editor.export_workers = args.workers
+    editor.export_threads = args.threads
+    editor.join_engine = args.join_engine
+    if args.cache:
+        editor.render_cache = RenderCache()
+    editor.resource_planner = ResourcePlanner(
+        disk_budget=parse_size(args.disk_budget) if args.disk_budget else None,
+        memory_budget=parse_size(args.memory_budget) if args.memory_budget else None)
+
+    def progress(finished, total):
+        print("Exported {}/{} splits".format(finished, total), file=sys.stderr)
+
+    sink = trace.open_sink(args.trace) if args.trace else None
+    if sink is not None:
+        trace.add_sink(sink)
+
+    pool = None
+    if args.remote_queue:
+        editor.export_runner = DistributedScheduler(FileQueueTransport(args.remote_queue),
+                                                    shared_storage=not args.upload_sources)
+    elif args.local_workers:
+        pool = LocalWorkerPool(args.local_workers, args.threads)
+        editor.export_runner = pool.start()
+
+    try:
+        succ, _ = editor.export_and_join_splits(split_ids, output, progress=progress)
+    finally:
+        if pool is not None:
+            pool.stop()
+        if sink is not None:
+            trace.remove_sink(sink)
+            sink.close()
+    return 0 if succ else 1
+
+
+def worker(args):
+    render_worker = Worker(FileQueueTransport(args.queue_dir), threads=args.threads)
+    # Stopping drops the current job, the submitter gives it to another worker
+    signal.signal(signal.SIGTERM, lambda *_: render_worker.stop(cancel_current=True))
+    try:
+        render_worker.work(wait=not args.once)
+    except KeyboardInterrupt:
+        render_worker.stop(cancel_current=True)
+    return 0
+
+
+def queue_submit(args):
+    editor, split_ids, output = load_input(args.edl, args.output)
+    editor.export_mode = args.mode
+    job_id = RenderQueue(JobStore(args.store)).submit(editor, split_ids, os.path.abspath(output), args.priority)
+    print(job_id)
+    return 0
+
+
+def queue_list(args):
+    for job in JobStore(args.store).list(args.status):
+        print("{id:>5}  {status:<9}  {progress:>4.0%}  prio {priority:<3}  {output}  {message}".format(**job))
+    return 0
+
+
+def queue_cancel(args):
+    RenderQueue(JobStore(args.store)).cancel(args.job_id)
+    return 0
+
+
+def queue_run(args):
+    queue = RenderQueue(JobStore(args.store), concurrency=args.concurrency)
+    queue.start(wait=args.watch)
+    try:
+        queue.join()
+    except KeyboardInterrupt:
+        queue.stop()
+    return 0
+
+
+def benchmark(args):
+    from video_editor.benchmark import main as benchmark_main
+    return benchmark_main(args)
+
+
+def interface(args):
+    from video_editor import open_interface
+    open_interface()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="python -m video_editor")
+    subparsers = parser.add_subparsers(dest="command")
+
+    export_parser = subparsers.add_parser("export", help="Export an edit decision list or project headlessly")
+    export_parser.add_argument("edl", help="JSON or YAML edit decision list, or project file")
+    export_parser.add_argument("-o", "--output", help="Output file, overrides the one in the list")
+    export_parser.add_argument("--mode", default="fused", choices=["fused", "chained", "piped"])
+    export_parser.add_argument("--join-engine", default="auto", choices=["auto", "concat", "filter"],
+                               help="Join exported splits with the concat demuxer or in a single filter graph")
+    export_parser.add_argument("--workers", type=int, help="Number of splits exported concurrently")
+    export_parser.add_argument("--threads", type=int, help="ffmpeg threads per split")
+    export_parser.add_argument("--cache", action="store_true",
+                               help="Reuse split renders kept in ${}/renders "
+                                    "(~/.cache/video_editor/renders by default), up to {}GB".format(
+                                        CACHE_DIR_ENV_VAR, DEFAULT_CACHE_SIZE // 1024 ** 3))
+    export_parser.add_argument("--trace", help="Write stage timings, as Chrome trace (.json) or JSON lines")
+    export_parser.add_argument("--disk-budget", help="Max temporary disk space used, e.g. 50G")
+    export_parser.add_argument("--memory-budget", help="Max memory used by concurrent ffmpeg processes, e.g. 8G")
+    export_parser.add_argument("--remote-queue", help="Queue directory where workers pick up the split renders")
+    export_parser.add_argument("--upload-sources", action="store_true",
+                               help="Copy the source into the queue, for workers without access to it")
+    export_parser.add_argument("--local-workers", type=int, help="Render splits in this many worker processes")
+    export_parser.set_defaults(func=export)
+
+    worker_parser = subparsers.add_parser("worker", help="Render splits from a queue directory")
+    worker_parser.add_argument("queue_dir", help="Queue directory shared with the submitting machine")
+    worker_parser.add_argument("--threads", type=int, help="ffmpeg threads per split")
+    worker_parser.add_argument("--once", action="store_true", help="Stop once the queue is empty")
+    worker_parser.set_defaults(func=worker)
+
+    queue_parser = subparsers.add_parser("queue", help="Manage the persistent render queue")
+    queue_parser.add_argument("--store", help="Job store database, queue.sqlite in the cache folder by default. "
+                                              "The interface keeps its jobs apart, in {}".format(GUI_STORE))
+    queue_subparsers = queue_parser.add_subparsers(dest="queue_command", required=True)
+
+    submit_parser = queue_subparsers.add_parser("submit", help="Queue an edit decision list or project")
+    submit_parser.add_argument("edl", help="JSON or YAML edit decision list, or project file")
+    submit_parser.add_argument("-o", "--output", help="Output file, overrides the one in the list")
+    submit_parser.add_argument("--priority", type=int, default=0, help="Higher priorities run first")
+    submit_parser.add_argument("--mode", default="fused", choices=["fused", "chained", "piped"])
+    submit_parser.set_defaults(func=queue_submit)
+
+    list_parser = queue_subparsers.add_parser("list", help="List jobs")
+    list_parser.add_argument("--status", nargs="*", help="Only list jobs with these statuses")
+    list_parser.set_defaults(func=queue_list)
+
+    cancel_parser = queue_subparsers.add_parser("cancel", help="Cancel a job")
+    cancel_parser.add_argument("job_id", type=int)
+    cancel_parser.set_defaults(func=queue_cancel)
+
+    run_parser = queue_subparsers.add_parser("run", help="Run queued jobs, resuming interrupted ones")
+    run_parser.add_argument("--concurrency", type=int, default=1, help="Jobs exported at the same time")
+    run_parser.add_argument("--watch", action="store_true", help="Keep waiting for new jobs")
+    run_parser.set_defaults(func=queue_run)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Benchmark exports on synthetic media")
+    benchmark_parser.add_argument("-o", "--output", help="JSON file where results are written")
+    benchmark_parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    benchmark_parser.add_argument("--mode", default="fused", choices=["fused", "chained", "piped"])
+    benchmark_parser.add_argument("--quick", action="store_true", help="Only use the smallest source")
+    benchmark_parser.add_argument("--seek", action="store_true",
+                                  help="Measure speed and frame accuracy of the cut seek modes instead")
+    benchmark_parser.set_defaults(func=benchmark)
+
+    gui_parser = subparsers.add_parser("gui", help="Open the graphical interface")
+    gui_parser.set_defaults(func=interface)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.command is None:
+        return interface(args)
+    sys.exit(args.func(args))
@@ -0,0 +1,430 @@
+from video_editor.cache import get_default_cache_dir
+from video_editor.editor import Split
+from video_editor.project import get_content_hash
+from abc import ABC, abstractmethod
+from shutil import copyfile, move, rmtree
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# Seconds between polls of the queue, by the submitter and by idle workers
+POLL_INTERVAL = 0.5
+
+# A claimed job whose worker hasn't renewed it for this many seconds is given to another worker
+DEFAULT_LEASE = 60
+
+# Size of the pieces sources are uploaded in when workers don't share the storage
+BLOB_CHUNK_SIZE = 64 * 1024 ** 2
+
+
+def write_json(path, data):
+    # Written aside and renamed, readers never see a partial file
+    tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp_path, "wt") as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Transport(ABC):
+
+    """
+    Carries split render jobs between a submitter and workers. A job is a JSON serializable
+    spec, its result a (success, message) pair plus the rendered file. Sources are either
+    read in place by the workers (shared storage) or uploaded as blobs.
+    """
+
+    @abstractmethod
+    def put_job(self, job_id, spec):
+        pass
+
+    @abstractmethod
+    def claim_job(self):
+        # Returns (job_id, spec, claim) of a job no other worker holds, or None. The claim token
+        # identifies this attempt, it's lost once the job is given to another worker
+        pass
+
+    @abstractmethod
+    def renew(self, job_id, claim):
+        # Extends the lease of a claimed job, False once the job was cancelled or given away
+        pass
+
+    @abstractmethod
+    def requeue_stale(self, lease, batch):
+        # Puts back the jobs of a batch (job id prefix) whose lease expired and returns their ids
+        pass
+
+    @abstractmethod
+    def cancel(self, job_id):
+        pass
+
+    @abstractmethod
+    def put_result(self, job_id, claim, succ, msg, path=None):
+        # Ignored, returning False, when the claim was lost
+        pass
+
+    @abstractmethod
+    def get_result(self, job_id, dest_path):
+        # (success, message) once the job finished, the rendered file is moved to dest_path
+        pass
+
+    @abstractmethod
+    def put_blob(self, path):
+        # Uploads a file and returns its blob id
+        pass
+
+    @abstractmethod
+    def get_blob(self, blob_id, dest_path):
+        pass
+
+
+class FileQueueTransport(Transport):
+
+    """
+    Reference transport over a directory, local or on a network share. Jobs move between
+    pending/ and claimed/ by renaming, which is atomic, so exactly one worker gets each.
+    The mtime of a claimed job is its lease, the claim token is written in the job file.
+    """
+
+    def __init__(self, root):
+        self.root = root.replace("\\", "/")
+        for name in ('pending', 'claimed', 'results', 'blobs'):
+            os.makedirs(self.get_path(name), exist_ok=True)
+
+    def get_path(self, *parts):
+        return "/".join((self.root, ) + parts)
+
+    def put_job(self, job_id, spec):
+        remove_file(self.get_path('results', job_id + ".json"))
+        write_json(self.get_path('pending', job_id + ".json"), {'spec': spec, 'claim': None})
+
+    def claim_job(self):
+        for name in sorted(os.listdir(self.get_path('pending'))):
+            if not name.endswith(".json"):
+                continue
+            claimed_path = self.get_path('claimed', name)
+            try:
+                os.rename(self.get_path('pending', name), claimed_path)
+                # Renaming keeps the mtime, the lease starts now and not when the job was queued
+                os.utime(claimed_path)
+                with open(claimed_path, "rt") as job_file:
+                    job = json.load(job_file)
+            except FileNotFoundError:
+                # Taken by another worker
+                continue
+            # Rewriting the file also renews its lease
+            job['claim'] = uuid.uuid4().hex
+            write_json(claimed_path, job)
+            return name[:-len(".json")], job['spec'], job['claim']
+        return None
+
+    def holds_claim(self, job_id, claim):
+        try:
+            with open(self.get_path('claimed', job_id + ".json"), "rt") as job_file:
+                return json.load(job_file)['claim'] == claim
+        except FileNotFoundError:
+            return False
+
+    def renew(self, job_id, claim):
+        if not self.holds_claim(job_id, claim):
+            return False
+        try:
+            os.utime(self.get_path('claimed', job_id + ".json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def requeue_stale(self, lease, batch):
+        requeued = []
+        for name in os.listdir(self.get_path('claimed')):
+            # Jobs of other submitters are left to them
+            if not name.startswith(batch + "-") or not name.endswith(".json"):
+                continue
+            path = self.get_path('claimed', name)
+            try:
+                if time.time() - os.path.getmtime(path) < lease:
+                    continue
+                os.rename(path, self.get_path('pending', name))
+            except FileNotFoundError:
+                continue
+            requeued.append(name[:-len(".json")])
+        return requeued
+
+    def cancel(self, job_id):
+        for name in ('pending', 'claimed'):
+            remove_file(self.get_path(name, job_id + ".json"))
+
+    def put_result(self, job_id, claim, succ, msg, path=None):
+        if not self.holds_claim(job_id, claim):
+            return False
+        result = {'success': succ, 'message': msg, 'file': None}
+        if path is not None:
+            # Named after the claim, a late result of an earlier attempt can't overwrite it
+            result['file'] = "{}.{}.{}".format(job_id, claim, path.split(".")[-1])
+            copyfile(path, self.get_path('results', result['file'] + ".tmp"))
+            os.replace(self.get_path('results', result['file'] + ".tmp"), self.get_path('results', result['file']))
+        if not self.holds_claim(job_id, claim):
+            # Given away while uploading
+            if result['file'] is not None:
+                remove_file(self.get_path('results', result['file']))
+            return False
+        write_json(self.get_path('results', job_id + ".json"), result)
+        remove_file(self.get_path('claimed', job_id + ".json"))
+        return True
+
+    def get_result(self, job_id, dest_path):
+        result_path = self.get_path('results', job_id + ".json")
+        if not os.path.exists(result_path):
+            return None
+        with open(result_path, "rt") as result_file:
+            result = json.load(result_file)
+        if result['file'] is not None:
+            move(self.get_path('results', result['file']), dest_path)
+        os.remove(result_path)
+        return result['success'], result['message']
+
+    def put_blob(self, path):
+        blob_id = "{}.{}".format(get_content_hash(path), path.split(".")[-1])
+        blob_dir = self.get_path('blobs', blob_id)
+        if os.path.exists(blob_dir + "/manifest.json"):
+            return blob_id
+
+        os.makedirs(blob_dir, exist_ok=True)
+        count = 0
+        with open(path, "rb") as source_file:
+            while True:
+                chunk = source_file.read(BLOB_CHUNK_SIZE)
+                if not chunk:
+                    break
+                with open("{}/{:06d}".format(blob_dir, count), "wb") as chunk_file:
+                    chunk_file.write(chunk)
+                count += 1
+        # The manifest is written last, the blob is complete once it exists
+        write_json(blob_dir + "/manifest.json", {'chunks': count, 'size': os.path.getsize(path)})
+        return blob_id
+
+    def get_blob(self, blob_id, dest_path):
+        blob_dir = self.get_path('blobs', blob_id)
+        with open(blob_dir + "/manifest.json", "rt") as manifest_file:
+            manifest = json.load(manifest_file)
+        tmp_path = "{}.{}.tmp".format(dest_path, uuid.uuid4().hex)
+        with open(tmp_path, "wb") as dest_file:
+            for i in range(manifest['chunks']):
+                with open("{}/{:06d}".format(blob_dir, i), "rb") as chunk_file:
+                    dest_file.write(chunk_file.read())
+        if os.path.getsize(tmp_path) != manifest['size']:
+            os.remove(tmp_path)
+            raise OSError("Incomplete blob {}".format(blob_id))
+        os.replace(tmp_path, dest_path)
+
+
+class DistributedScheduler:
+
+    """
+    Hands split render jobs to workers through a transport and gathers the rendered files
+    back in job order. Failed jobs, and jobs of workers that stopped renewing their lease,
+    are retried up to `retries` times.
+    """
+
+    def __init__(self, transport, shared_storage=True, retries=2, lease=DEFAULT_LEASE):
+        self.transport = transport
+        self.shared_storage = shared_storage
+        self.retries = retries
+        self.lease = lease
+
+    def get_spec(self, split, options, blobs):
+        spec = {
+            'source': split.video_path,
+            'blob': None,
+            'start': split.start_time,
+            'end': split.end_time,
+            'config': split.config,
+            'options': options,
+        }
+        if not self.shared_storage:
+            if split.video_path not in blobs:
+                blobs[split.video_path] = self.transport.put_blob(split.video_path)
+            spec['blob'] = blobs[split.video_path]
+        return spec
+
+    def run(self, splits, options, dir_path, progress=None, cancel=None):
+        """
+        Renders the splits with the same export options, returns (True, paths) with the
+        files in dir_path in split order, or (False, message).
+        """
+        batch = uuid.uuid4().hex[:12]
+        job_ids = ["{}-{:04d}".format(batch, i) for i in range(len(splits))]
+        outputs = ["{}/{}.{}".format(dir_path, i, split.video_path.split('/')[-1].split(".")[-1])
+                   for i, split in enumerate(splits)]
+        blobs = dict()
+        specs = [self.get_spec(split, options, blobs) for split in splits]
+
+        for job_id, spec in zip(job_ids, specs):
+            self.transport.put_job(job_id, spec)
+        attempts = [0] * len(splits)
+        pending = set(range(len(splits)))
+        if progress is not None:
+            progress(0, len(splits))
+
+        def retry(i, msg):
+            attempts[i] += 1
+            if attempts[i] > self.retries:
+                return False
+            print("RETRYING SPLIT JOB {} ({})".format(job_ids[i], msg.strip().split("\n")[-1]))
+            self.transport.put_job(job_ids[i], specs[i])
+            return True
+
+        try:
+            while pending:
+                for job_id in self.transport.requeue_stale(self.lease, batch):
+                    if job_id in job_ids and not retry(job_ids.index(job_id), "worker lost"):
+                        return False, "Worker lost while rendering {}".format(job_id)
+
+                for i in sorted(pending):
+                    result = self.transport.get_result(job_ids[i], outputs[i])
+                    if result is None:
+                        continue
+                    succ, msg = result
+                    if succ:
+                        pending.discard(i)
+                        if progress is not None:
+                            progress(len(splits) - len(pending), len(splits))
+                    elif not retry(i, msg):
+                        return False, msg
+
+                if pending and cancel is not None and cancel.wait(POLL_INTERVAL):
+                    return False, "Cancelled"
+                if pending and cancel is None:
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            for i in pending:
+                self.transport.cancel(job_ids[i])
+
+        return True, outputs
+
+
+class Worker:
+
+    """
+    Takes jobs from a transport and renders them, renewing the lease while it works.
+    Uploaded sources are kept in a local cache between jobs.
+    """
+
+    def __init__(self, transport, threads=None, lease=DEFAULT_LEASE, blob_dir=None):
+        self.transport = transport
+        self.threads = threads
+        self.lease = lease
+        self.blob_dir = blob_dir or get_default_cache_dir("blobs")
+        self.stopping = threading.Event()
+        self.current_cancel = None
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def get_source(self, spec):
+        if spec['blob'] is None:
+            return spec['source']
+        path = "{}/{}".format(self.blob_dir, spec['blob'])
+        if not os.path.exists(path):
+            self.transport.get_blob(spec['blob'], path)
+        return path
+
+    def keep_lease(self, job_id, claim, cancel, finished):
+        while not finished.wait(self.lease / 4):
+            if not self.transport.renew(job_id, claim):
+                cancel.set()
+                return
+
+    def render(self, job_id, spec, claim):
+        cancel, finished = threading.Event(), threading.Event()
+        self.current_cancel = cancel
+        threading.Thread(target=self.keep_lease, args=(job_id, claim, cancel, finished), daemon=True).start()
+        dir_path = tempfile.mkdtemp()
+        try:
+            extension = spec['source'].split('/')[-1].split(".")[-1]
+            split = Split(self.get_source(spec), spec['start'], spec['end'])
+            split.config = spec['config']
+            output_path = "{}/{}.{}".format(dir_path.replace("\\", "/"), job_id, extension)
+            succ, msg = split.export(output_path, threads=self.threads, cancel=cancel, **spec['options'])
+            if cancel.is_set():
+                # Cancelled or given to another worker, nobody waits for this result
+                return
+            self.transport.put_result(job_id, claim, succ, msg, output_path if succ else None)
+        except Exception as e:
+            # A bad job fails alone, the worker goes on with the next one
+            print("SPLIT JOB {} FAILED\n".format(job_id), repr(e))
+            try:
+                self.transport.put_result(job_id, claim, False, repr(e))
+            except OSError:
+                pass
+        finally:
+            finished.set()
+            rmtree(dir_path, ignore_errors=True)
+
+    def work(self, wait=True):
+        while not self.stopping.is_set():
+            job = self.transport.claim_job()
+            if job is None:
+                if not wait:
+                    return
+                self.stopping.wait(POLL_INTERVAL)
+                continue
+            self.render(*job)
+
+    def stop(self, cancel_current=False):
+        # The job being rendered is dropped, its lease expires and another worker retries it
+        self.stopping.set()
+        if cancel_current and self.current_cancel is not None:
+            self.current_cancel.set()
+
+
+class LocalWorkerPool:
+
+    """
+    Single host mode: worker processes on this machine over a temporary file queue.
+    Used as a context manager, its scheduler can be set as the editor's export runner.
+    """
+
+    def __init__(self, count=2, threads=None, root=None):
+        self.count = count
+        self.threads = threads
+        self.root = root
+        self.tmp_root = None
+        self.processes = []
+        self.scheduler = None
+
+    def start(self):
+        if self.root is None:
+            self.tmp_root = tempfile.mkdtemp(prefix="video_editor_queue_")
+        root = (self.root or self.tmp_root).replace("\\", "/")
+        self.scheduler = DistributedScheduler(FileQueueTransport(root))
+        command = [sys.executable, "-m", "video_editor", "worker", root]
+        if self.threads:
+            command += ["--threads", str(self.threads)]
+        self.processes = [subprocess.Popen(command) for _ in range(self.count)]
+        return self.scheduler
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        self.processes = []
+        if self.tmp_root is not None:
+            rmtree(self.tmp_root, ignore_errors=True)
+            self.tmp_root = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
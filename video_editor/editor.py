@@ -1,7 +1,63 @@
+from video_editor._helpers import run_pipeline
 from video_editor.actions import CutAction, CompressAction, RemoveAudioAction, SpeedupAction
-from video_editor.utils import join_video_list
+from video_editor.aio import run_in_thread
+from video_editor.history import History, Snapshot, SplitState, diff, freeze, freeze_config, thaw
+from video_editor.keyframes import get_keyframe_index
+from video_editor.probe import try_get_media_info
+from video_editor.pipeline import SplitPipeline, TimelinePipeline, get_encoder_args
+from video_editor.profiles import get_config_profile, get_profile_args
+from video_editor.resources import ResourcePlanner, temp_directory
+from video_editor.scheduler import ExportScheduler
+from video_editor.speed import SpeedCurve
+from video_editor.utils import join_video_list, join_video_list_async
+from video_editor import trace
+from functools import partial
+import asyncio
+from bisect import bisect_right
+from copy import deepcopy
 import tempfile
-from shutil import copyfile
+from shutil import copyfile, move
+import os
+
+# Above this many splits the filter graph gets too large, the concat demuxer is used
+FILTER_JOIN_MAX_SPLITS = 16
+
+# Source time (ms) between the splits the filter graph may decode for nothing, above it
+# the splits are rendered on their own with input seeking
+FILTER_JOIN_MAX_GAP = 30 * 1000
+
+# Seek strategy of reencoded cuts, see actions.SEEK_MODES
+SEEK_MODE = 'hybrid'
+
+# Streamable container passed between piped stages, its default encoders match the usual outputs
+PIPE_FORMAT = 'matroska'
+
+
+def get_seek_keyframes(video_path):
+    # Keyframes used by hybrid seeking, cuts fall back to input seeking if they can't be read
+    try:
+        return get_keyframe_index(video_path)
+    except (OSError, SystemError):
+        return None
+
+
+def source_has_audio(video_path):
+    # Sources that can't be probed are assumed to have audio, as ffmpeg alone did
+    info = try_get_media_info(video_path)
+    return info.has_audio if info is not None else True
+
+
+async def run_actions_async(actions, progress=None, timeout=None, remove_inputs=False):
+    # Runs (name, action) pairs in order, stopping at the first failure
+    for i, (name, action) in enumerate(actions):
+        succ, msg = await action.run_async(progress, timeout)
+        if not succ:
+            print("{} FAILED\n".format(name), msg)
+            return False, msg
+        if remove_inputs and i > 0:
+            # Intermediate files are deleted as soon as the next stage consumed them
+            os.remove(action.input)
+    return True, msg
 
 
 class VideoEditor:
@@ -9,15 +65,78 @@ class VideoEditor:
     def __init__(self, video_path, video_length):
         self.video_path = video_path
         self.video_length = video_length
-        self.splits = [Split(video_path, 0, video_length)]
+        self.splits = SplitList([Split(video_path, 0, video_length)])
+        self.listeners = []
+        self.export_mode = 'fused'
+        self.export_workers = None
+        self.export_threads = None
+        self.render_cache = None
+        self.join_engine = 'auto'
+        # Renders the splits of a join elsewhere, e.g. a distributed.DistributedScheduler
+        self.export_runner = None
+        self.resource_planner = ResourcePlanner()
+        self.history = History(self.snapshot())
+
+    @classmethod
+    def from_splits(cls, video_path, video_length, splits):
+        # Builds an editor from (start_time, end_time, config) tuples, with an empty history
+        editor = cls(video_path, video_length)
+        editor.splits = SplitList(Split.from_state(video_path, SplitState(start_time, end_time, freeze(config)))
+                                  for start_time, end_time, config in splits)
+        editor.history = History(editor.snapshot())
+        return editor
+
+    def snapshot(self):
+        return Snapshot.build([split.state for split in self.splits])
+
+    def commit(self, start=None, stop=None, new_stop=None):
+        """
+        Records the current splits as a new undo step. When an edit replaced the splits
+        [start, stop) of the previous step with the splits now in [start, new_stop), only
+        those are read.
+        """
+        if start is None:
+            self.history.push(self.snapshot())
+            return
+        states = [split.state for split in self.splits[start:new_stop]]
+        self.history.push(self.history.current.replace(start, stop, states))
+
+    def restore(self, snapshot):
+        self.splits = SplitList(Split.from_state(self.video_path, state) for state in snapshot)
+        self.notify('reset')
+
+    def undo(self):
+        snapshot = self.history.undo()
+        if snapshot is not None:
+            self.restore(snapshot)
+        return snapshot is not None
+
+    def redo(self):
+        snapshot = self.history.redo()
+        if snapshot is not None:
+            self.restore(snapshot)
+        return snapshot is not None
+
+    def get_changes(self, snapshot):
+        # Splits (as SplitState) removed and added since the given snapshot
+        return diff(snapshot, self.history.current)
+
+    def add_listener(self, callback):
+        # Callbacks receive (event, split_id), event being 'insert', 'remove', 'update' or 'reset'
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def notify(self, event, split_id=None):
+        for callback in self.listeners:
+            callback(event, split_id)
 
     def add_split(self, time):
         # Find new split position
-        k = len(self.splits)
-        for i, split in enumerate(self.splits):
-            if split.end_time > time:
-                k = i
-                break
+        k = self.splits.find(time)
+        if k is None or self.splits[k].start_time == time:
+            return None
 
         # Create the new split
         split = self.splits[k]
@@ -26,11 +145,45 @@ class VideoEditor:
         self.splits.insert(k, new_split)
 
         # Edit affected split
-        split.start_time = time
+        self.splits.set_start_time(k + 1, time)
+
+        self.commit(k, k + 1, k + 2)
+        self.notify('insert', k)
+        self.notify('update', k + 1)
+        return k
+
+    def add_splits(self, times):
+        # Bulk insertion, the split list is rebuilt once instead of once per split
+        times = sorted(set(times))
+        splits = []
+        i = 0
+        for split in self.splits:
+            while i < len(times) and times[i] <= split.start_time:
+                i += 1
+            while i < len(times) and times[i] < split.end_time:
+                new_split = split.copy()
+                new_split.end_time = times[i]
+                splits.append(new_split)
+                split.start_time = times[i]
+                i += 1
+            splits.append(split)
+
+        added = len(splits) - len(self.splits)
+        self.splits = SplitList(splits)
+        self.commit()
+        self.notify('reset')
+        return added
 
     def update_split(self, split_id, config):
         split = self.splits[split_id]
+        if freeze_config(config) == freeze_config(split.config):
+            # Nothing changed, no undo step, e.g. the edit dialog closed with the defaults
+            return
+        # Raises ValueError for an invalid speed curve before anything changes
+        SpeedCurve.from_config(config, split.duration)
         split.config = config
+        self.commit(split_id, split_id + 1, split_id + 1)
+        self.notify('update', split_id)
 
     def get_splits(self):
         return self.splits
@@ -42,32 +195,289 @@ class VideoEditor:
         split = self.splits[split_id]
         removed_split = self.splits.pop(split_id + 1)
         split.end_time = removed_split.end_time
+        self.commit(split_id, split_id + 2, split_id + 1)
+        self.notify('remove', split_id + 1)
+        self.notify('update', split_id)
 
     def merge_split_with_previous(self, split_id):
-        split = self.splits[split_id]
         removed_split = self.splits.pop(split_id - 1)
-        split.start_time = removed_split.start_time
+        self.splits.set_start_time(split_id - 1, removed_split.start_time)
+        self.commit(split_id - 1, split_id + 1, split_id)
+        self.notify('remove', split_id - 1)
+        self.notify('update', split_id - 1)
+
+    def export_split(self, split_id, output_file, progress=None, cancel=None):
+        with trace.context(split_id=split_id):
+            return self.splits[split_id].export(output_file, mode=self.export_mode, cache=self.render_cache,
+                                                progress=progress, cancel=cancel)
+
+    def get_join_engine(self, split_ids, copy):
+        # Splits rendered elsewhere are always joined with the concat demuxer
+        if self.export_runner is not None:
+            return 'concat'
+        if self.join_engine != 'auto':
+            return self.join_engine
+
+        splits = [self.splits[split_id] for split_id in split_ids]
+        if copy or len(splits) > FILTER_JOIN_MAX_SPLITS:
+            return 'concat'
+
+        # The source is read once, splits out of order would have to be buffered
+        if any(split.start_time >= next_split.start_time for split, next_split in zip(splits, splits[1:])):
+            return 'concat'
+
+        # Everything between the splits is decoded
+        if sum(next_split.start_time - split.end_time for split, next_split in zip(splits, splits[1:])) > \
+                FILTER_JOIN_MAX_GAP:
+            return 'concat'
+
+        # Splits already rendered are only joined
+        if self.render_cache is not None:
+            extension = self.video_path.split('/')[-1].split(".")[-1]
+            if any(self.render_cache.contains(split.get_cache_key(self.render_cache, True, self.export_mode),
+                                              extension) for split in splits):
+                return 'concat'
+
+        # A single output can only have one set of encoder settings
+        encoders = set(tuple(get_encoder_args(split.config) or ()) for split in splits)
+        return 'filter' if len(encoders) == 1 else 'concat'
+
+    def get_timeline_action(self, split_ids, output_file):
+        splits = [self.splits[split_id] for split_id in split_ids]
+        segments = [(split.start_time, split.end_time, split.config) for split in splits]
+        action = TimelinePipeline(self.video_path, output_file, segments,
+                                  has_audio=source_has_audio(self.video_path),
+                                  keyframes=get_seek_keyframes(self.video_path))
+        action.threads = self.export_threads
+        return action
+
+    def join_splits_with_filter(self, split_ids, output_file, progress=None, split_progress=None, cancel=None):
+        if progress is not None:
+            progress(0, 1)
+
+        action = self.get_timeline_action(split_ids, output_file)
+        join_progress = partial(split_progress, None) if split_progress is not None else None
+        succ, msg = action.run(join_progress, cancel)
+        if not succ:
+            print("TIMELINE PIPELINE FAILED\n", msg)
+            return False, msg
+
+        if progress is not None:
+            progress(1, 1)
+        return True, output_file
+
+    def plan_export(self, split_ids, output_file, copy):
+        # Checks the disk space up front and picks the temp folder and number of workers
+        succ, plan = self.resource_planner.plan([self.splits[split_id] for split_id in split_ids],
+                                                'smart' if copy else self.export_mode, output_file,
+                                                self.export_workers, cached=self.render_cache is not None)
+        if not succ:
+            print("NOT ENOUGH RESOURCES\n", plan)
+        return succ, plan
+
+    def export_and_join_splits(self, split_ids, output_file, progress=None, split_progress=None, cancel=None):
+        # Unmodified splits can be stream copied and joined without reencoding
+        index = get_seek_keyframes(self.video_path)
+        copy = all(self.splits[split_id].is_unmodified() for split_id in split_ids) and \
+            index is not None and index.smart_render_encoder is not None
+
+        # The filter graph is a single command writing no intermediate, there's nothing to plan
+        if self.get_join_engine(split_ids, copy) == 'filter':
+            return self.join_splits_with_filter(split_ids, output_file, progress, split_progress, cancel)
+
+        succ, plan = self.plan_export(split_ids, output_file, copy)
+        if not succ:
+            return False, plan
 
-    def export_split(self, split_id, output_file):
-        self.splits[split_id].export(output_file)
-
-    def export_and_join_splits(self, split_ids, output_file):
         *_, video_extension = self.video_path.split('/')[-1].split(".")
+        scheduler = ExportScheduler(plan.workers, self.export_threads, progress=progress, cancel=cancel)
 
-        with tempfile.TemporaryDirectory() as dir_path:
-            dir_path = dir_path.replace("\\", "/")
-            list_file_path = "{}/list_file.txt".format(dir_path)
+        # Cached splits of this export, pinned until they're joined
+        rendered = []
 
-            with open(list_file_path, "wt") as list_file:
+        def render(split_id, **options):
+            succ, msg = self.splits[split_id].render(self.render_cache, **options)
+            if succ:
+                rendered.append(msg)
+            return succ, msg
 
-                for split_id in split_ids:
-                    split_tmp_output = "{}/{}.{}".format(dir_path, split_id, video_extension)
-                    self.splits[split_id].export(split_tmp_output, force_reencode=True)
-                    list_file.write('file {}.{}\n'.format(split_id, video_extension))
+        with tempfile.TemporaryDirectory(dir=plan.temp_dir) as dir_path:
+            dir_path = dir_path.replace("\\", "/")
+            list_file_path = "{}/list_file.txt".format(dir_path)
 
-            succ, msg = join_video_list(list_file_path, output_file)
+            jobs = []
+            for split_id in split_ids:
+                split_tmp_output = "{}/{}.{}".format(dir_path, split_id, video_extension)
+                options = dict(mode='smart') if copy else dict(force_reencode=True, mode=self.export_mode)
+                if split_progress is not None:
+                    options['progress'] = partial(split_progress, split_id)
+                if self.render_cache is not None:
+                    job = partial(render, split_id, **options)
+                else:
+                    job = partial(self.splits[split_id].export, split_tmp_output, **options)
+                jobs.append(trace.bind(job, split_id=split_id))
+
+            try:
+                if self.export_runner is not None:
+                    # Workers render without the render cache and report no per split progress
+                    options = dict(mode='smart') if copy else dict(force_reencode=True, mode=self.export_mode)
+                    succ, results = self.export_runner.run([self.splits[split_id] for split_id in split_ids],
+                                                           options, dir_path, progress, scheduler.cancel)
+                else:
+                    succ, results = scheduler.run(jobs)
+                if not succ:
+                    print("EXPORT SPLITS FAILED\n", results)
+                    return False, results
+
+                # Splits are listed in selection order, wherever they were rendered
+                with open(list_file_path, "wt") as list_file:
+                    for split_path in results:
+                        list_file.write("file '{}'\n".format(split_path.replace("'", "'\\''")))
+
+                join_progress = partial(split_progress, None) if split_progress is not None else None
+                succ, msg = join_video_list(list_file_path, output_file, copy=copy, progress=join_progress,
+                                            cancel=scheduler.cancel)
+            finally:
+                if rendered:
+                    self.render_cache.release(*rendered)
             if not succ:
                 print("JOIN SPLITS FAILED\n", msg)
+                return False, msg
+            return True, output_file
+
+    async def export_split_async(self, split_id, output_file, progress=None, timeout=None):
+        with trace.context(split_id=split_id):
+            return await self.splits[split_id].export_async(output_file, mode=self.export_mode,
+                                                            cache=self.render_cache, progress=progress,
+                                                            timeout=timeout)
+
+    async def export_and_join_splits_async(self, split_ids, output_file, progress=None, split_progress=None,
+                                           timeout=None):
+        """
+        Coroutine version of export_and_join_splits. Splits are exported concurrently, the
+        ffmpeg processes running at once are limited by aio.set_max_processes. timeout
+        applies to each process and cancelling the task stops every export.
+        """
+        index = await run_in_thread(get_seek_keyframes, self.video_path)
+        copy = all(self.splits[split_id].is_unmodified() for split_id in split_ids) and \
+            index is not None and index.smart_render_encoder is not None
+        join_progress = partial(split_progress, None) if split_progress is not None else None
+
+        # Choosing the engine may probe the encoders and the render cache
+        if await run_in_thread(self.get_join_engine, split_ids, copy) == 'filter':
+            action = await run_in_thread(self.get_timeline_action, split_ids, output_file)
+            succ, msg = await run_actions_async([("TIMELINE PIPELINE", action)], join_progress, timeout)
+            if not succ:
+                return False, msg
+            if progress is not None:
+                progress(1, 1)
+            return True, output_file
+
+        succ, plan = await run_in_thread(self.plan_export, split_ids, output_file, copy)
+        if not succ:
+            return False, plan
+
+        *_, video_extension = self.video_path.split('/')[-1].split(".")
+        finished = []
+        # Cached splits of this export, pinned until they're joined
+        rendered = []
+        # Only as many splits as the plan allows are exported at once
+        slots = asyncio.Semaphore(plan.workers)
+
+        async def export(split_id, split_tmp_output):
+            options = dict(mode='smart') if copy else dict(force_reencode=True, mode=self.export_mode)
+            options.update(threads=self.export_threads, timeout=timeout)
+            if split_progress is not None:
+                options['progress'] = partial(split_progress, split_id)
+            async with slots:
+                with trace.context(split_id=split_id):
+                    if self.render_cache is not None:
+                        result = await self.splits[split_id].render_async(self.render_cache, **options)
+                        if result[0]:
+                            rendered.append(result[1])
+                    else:
+                        result = await self.splits[split_id].export_async(split_tmp_output, **options)
+            finished.append(split_id)
+            if progress is not None:
+                progress(len(finished), len(split_ids))
+            return result
+
+        try:
+            with tempfile.TemporaryDirectory(dir=plan.temp_dir) as dir_path:
+                dir_path = dir_path.replace("\\", "/")
+                list_file_path = "{}/list_file.txt".format(dir_path)
+
+                tasks = [asyncio.ensure_future(export(split_id, "{}/{}.{}".format(dir_path, split_id, video_extension)))
+                         for split_id in split_ids]
+                try:
+                    # The first failure cancels the exports still running
+                    pending = set(tasks)
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            succ, msg = task.result()
+                            if not succ:
+                                print("EXPORT SPLITS FAILED\n", msg)
+                                return False, msg
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    # Processes are killed before the temp folder is removed
+                    await asyncio.gather(*tasks, return_exceptions=True)
+
+                with open(list_file_path, "wt") as list_file:
+                    for task in tasks:
+                        split_path = task.result()[1]
+                        list_file.write("file '{}'\n".format(split_path.replace("'", "'\\''")))
+
+                succ, msg = await join_video_list_async(list_file_path, output_file, copy=copy, progress=join_progress,
+                                                        timeout=timeout)
+                if not succ:
+                    print("JOIN SPLITS FAILED\n", msg)
+                    return False, msg
+                return True, output_file
+        finally:
+            if rendered:
+                self.render_cache.release(*rendered)
+
+
+class SplitList:
+
+    """
+    Contiguous splits sorted by time. Start times are kept in a parallel list so the split
+    at a given time is found by bisection.
+    """
+
+    def __init__(self, splits):
+        self.splits = list(splits)
+        self.starts = [split.start_time for split in self.splits]
+
+    def __len__(self):
+        return len(self.splits)
+
+    def __getitem__(self, index):
+        return self.splits[index]
+
+    def __iter__(self):
+        return iter(self.splits)
+
+    def find(self, time):
+        k = bisect_right(self.starts, time) - 1
+        if k < 0 or time >= self.splits[k].end_time:
+            return None
+        return k
+
+    def insert(self, index, split):
+        self.splits.insert(index, split)
+        self.starts.insert(index, split.start_time)
+
+    def pop(self, index):
+        del self.starts[index]
+        return self.splits.pop(index)
+
+    def set_start_time(self, index, time):
+        self.splits[index].start_time = time
+        self.starts[index] = time
 
 
 class Split:
@@ -77,10 +487,12 @@ class Split:
     {
       'reencode': False,
       'compress': True,
+      'profile': 'balanced',
       'removeaudio': False,
       'speedup': {
         'factor': 2,
         'dropframes': True,
+        'curve': [[0, 1], [2000, 4]],  # optional speed ramp, see speed.SpeedCurve
       }
     }
     """
@@ -90,72 +502,327 @@ class Split:
         self.start_time = start_time
         self.end_time = end_time
         self.config = dict()
+        self._state = None
+
+    @classmethod
+    def from_state(cls, video_path, state):
+        split = cls(video_path, state.start_time, state.end_time)
+        split.config = thaw(state.config)
+        split._state = state
+        return split
+
+    @property
+    def state(self):
+        # The previous state object is reused while nothing changed, so snapshots share it
+        state = SplitState(self.start_time, self.end_time, freeze(self.config))
+        if state != self._state:
+            self._state = state
+        return self._state
 
     @property
     def duration(self):
         return self.end_time - self.start_time
 
-    def export(self, output_path, force_reencode=False):
+    @property
+    def output_duration(self):
+        curve = SpeedCurve.from_config(self.config)
+        if curve is not None:
+            return curve.output_duration(self.duration)
+        return self.duration
+
+    def is_unmodified(self):
+        keys = ('reencode', 'compress', 'removeaudio', 'speedup')
+        return not any(self.config.get(key, False) for key in keys)
+
+    def get_cache_key(self, cache, force_reencode=False, mode='fused'):
+        profile = get_config_profile(self.config)
+        return cache.get_key(self.video_path, self.start_time, self.end_time, self.config,
+                             force_reencode=force_reencode, mode=mode, seek=SEEK_MODE,
+                             profile=get_profile_args(profile) if profile else None)
+
+    def render(self, cache, force_reencode=False, mode='fused', threads=None, progress=None, cancel=None):
+        # Returns the path of the rendered split inside the cache, rendering it only if missing
+        video_extension = self.video_path.split('/')[-1].split(".")[-1]
+        key = self.get_cache_key(cache, force_reencode, mode)
+        cached_path = cache.get(key, video_extension)
+        if cached_path is not None:
+            return True, cached_path
+
+        tmp_path = cache.reserve(video_extension)
+        succ, msg = self.export(tmp_path, force_reencode=force_reencode, mode=mode, threads=threads,
+                                progress=progress, cancel=cancel)
+        if not succ:
+            cache.discard(tmp_path)
+            return False, msg
+        return True, cache.commit(tmp_path, key, video_extension)
+
+    def export(self, output_path, force_reencode=False, mode='fused', threads=None, cache=None,
+               progress=None, cancel=None):
+        if cache is not None:
+            succ, msg = self.render(cache, force_reencode, mode, threads, progress, cancel)
+            if not succ:
+                return False, msg
+            try:
+                copyfile(msg, output_path)
+            finally:
+                cache.release(msg)
+            return True, output_path
+        if mode == 'smart' and not force_reencode and self.is_unmodified():
+            return self.export_smart(output_path, threads, progress, cancel)
+        if mode in ('fused', 'smart'):
+            return self.export_fused(output_path, force_reencode, threads, progress, cancel)
+        if mode == 'piped':
+            return self.export_piped(output_path, force_reencode, threads, progress, cancel)
+        return self.export_chained(output_path, force_reencode, threads, progress, cancel)
+
+    def get_fused_action(self, output_path, force_reencode=False, threads=None):
+        keyframes = get_seek_keyframes(self.video_path) if force_reencode or not self.is_unmodified() else None
+        action = SplitPipeline(self.video_path, output_path, self.start_time, self.end_time,
+                               self.config, force_reencode=force_reencode,
+                               has_audio=source_has_audio(self.video_path),
+                               seek=SEEK_MODE, keyframes=keyframes)
+        action.threads = threads
+        return action
+
+    def export_fused(self, output_path, force_reencode=False, threads=None, progress=None, cancel=None):
+        action = self.get_fused_action(output_path, force_reencode, threads)
+        succ, msg = action.run(progress, cancel)
+        if not succ:
+            print("SPLIT PIPELINE FAILED\n", msg)
+            return False, msg
+        return True, output_path
+
+    def export_smart(self, output_path, threads=None, progress=None, cancel=None):
+        index = get_seek_keyframes(self.video_path)
+        if index is None or not index.smart_render_encoder:
+            # Nothing to match the copied GOPs with, the split is stream copied like the others
+            return self.export_fused(output_path, threads=threads, progress=progress, cancel=cancel)
+
+        segments = index.get_segments(self.start_time, self.end_time)
+        if len(segments) == 1:
+            # Also reencoded with the source settings, the split is joined to copied ones
+            action = self.get_smart_cut_action(output_path, index, *segments[0], threads=threads)
+            succ, msg = action.run(progress, cancel)
+            if not succ:
+                print("SMART CUT ACTION FAILED\n", msg)
+                return False, msg
+            return True, output_path
+
+        # Reencode the partial GOPs at the edges and copy the ones in the middle
+        with temp_directory() as dir_path:
+            dir_path = dir_path.replace("\\", "/")
+            actions, list_file_path = self.get_smart_actions(dir_path, index, segments, threads)
+            for action in actions:
+                succ, msg = action.run(cancel=cancel)
+                if not succ:
+                    print("SMART CUT ACTION FAILED\n", msg)
+                    return False, msg
+
+            succ, msg = join_video_list(list_file_path, output_path, copy=True, cancel=cancel)
+            if not succ:
+                print("JOIN SEGMENTS FAILED\n", msg)
+                return False, msg
+            return True, output_path
+
+    def get_smart_cut_action(self, output_path, index, start_time, end_time, reencode, threads=None):
+        # Reencoded video matches the copied GOPs, so both can be joined with a stream copy
+        action = CutAction(self.video_path, output_path, start_time, end_time, reencode=reencode,
+                           video_codec=index.smart_render_encoder, seek=SEEK_MODE, keyframes=index,
+                           encoder_args=index.get_smart_render_args(output_path))
+        action.threads = threads
+        return action
+
+    def get_smart_actions(self, dir_path, index, segments, threads=None):
+        # Cut actions of the segments and the list file joining them, written in dir_path
+        video_extension = self.video_path.split('/')[-1].split(".")[-1]
+        list_file_path = "{}/list_file.txt".format(dir_path)
+        actions = []
+        with open(list_file_path, "wt") as list_file:
+            for i, (start_time, end_time, reencode) in enumerate(segments):
+                segment_path = "{}/{}.{}".format(dir_path, i, video_extension)
+                actions.append(self.get_smart_cut_action(segment_path, index, start_time, end_time, reencode,
+                                                         threads))
+                list_file.write('file {}.{}\n'.format(i, video_extension))
+        return actions, list_file_path
+
+    def get_chained_actions(self, tmp_output_path, force_reencode=False):
         def add_extension(path):
             return "{}.{}".format(path, video_extension)
 
         # Get config values
         conf_reencode = True if force_reencode else self.config.get('reencode', False)
         conf_compress = self.config.get('compress', False)
+        conf_profile = get_config_profile(self.config)
         conf_remove_audio = self.config.get('removeaudio', False)
         conf_speedup = self.config.get('speedup', False)
 
-        # Get video extension and name
-        *video_name, video_extension = self.video_path.split('/')[-1].split(".")
+        video_extension = self.video_path.split('/')[-1].split(".")[-1]
+        actions = []
+
+        # Cut split
+        keyframes = get_seek_keyframes(self.video_path) if conf_reencode else None
+        actions.append(("CUT", CutAction(self.video_path, add_extension(tmp_output_path),
+                                         self.start_time, self.end_time, reencode=conf_reencode,
+                                         seek=SEEK_MODE, keyframes=keyframes)))
+
+        # Compress split
+        if conf_compress:
+            input_path = add_extension(tmp_output_path)
+            tmp_output_path += '_C'
+            actions.append(("COMPRESS", CompressAction(input_path, add_extension(tmp_output_path),
+                                                       profile=conf_profile)))
+
+        # Remove audio from split
+        if conf_remove_audio:
+            input_path = add_extension(tmp_output_path)
+            tmp_output_path += '_NA'
+            actions.append(("REMOVE AUDIO", RemoveAudioAction(input_path, add_extension(tmp_output_path))))
+
+        # Speedup split
+        if conf_speedup and isinstance(conf_speedup, dict):
+            has_audio = source_has_audio(self.video_path)
+            factor = self.config['speedup'].get('factor', 1)
+            drop_frames = self.config['speedup'].get('dropframes', True)
+            input_path = add_extension(tmp_output_path)
+            tmp_output_path += '_SU'
+            actions.append(("SPEEDUP", SpeedupAction(input_path, add_extension(tmp_output_path), factor,
+                                                     drop_frames, has_audio=has_audio,
+                                                     curve=SpeedCurve.from_config(self.config))))
+
+        return actions
+
+    def export_chained(self, output_path, force_reencode=False, threads=None, progress=None, cancel=None):
+        # Get video name
+        *video_name, _ = self.video_path.split('/')[-1].split(".")
         video_name = ".".join(video_name)
 
         # Create temp folder
-        with tempfile.TemporaryDirectory() as dir_path:
+        with temp_directory() as dir_path:
             dir_path = dir_path.replace("\\", "/")
             tmp_output_path = "{}/{}_{}_{}".format(dir_path, video_name, self.start_time, self.end_time)
 
-            # Cut split
-            action = CutAction(self.video_path, add_extension(tmp_output_path),
-                               self.start_time, self.end_time, reencode=conf_reencode)
-            succ, msg = action.run()
-            if not succ:
-                return print("CUT ACTION FAILED\n", msg)
-
-            # Compress split
-            if conf_compress:
-                input_path = add_extension(tmp_output_path)
-                tmp_output_path += '_C'
-                action = CompressAction(input_path, add_extension(tmp_output_path))
-                succ, msg = action.run()
-                if not succ:
-                    return print("COMPRESS ACTION FAILED\n", msg)
-
-            # Remove audio from split
-            if conf_remove_audio:
-                input_path = add_extension(tmp_output_path)
-                tmp_output_path += '_NA'
-                action = RemoveAudioAction(input_path, add_extension(tmp_output_path))
-                succ, msg = action.run()
-                if not succ:
-                    return print("REMOVE AUDIO ACTION FAILED\n", msg)
-
-            # Speedup split
-            if conf_speedup and isinstance(conf_speedup, dict):
-                factor = self.config['speedup'].get('factor', 1)
-                drop_frames = self.config['speedup'].get('dropframes', True)
-                input_path = add_extension(tmp_output_path)
-                tmp_output_path += '_SU'
-                action = SpeedupAction(input_path, add_extension(tmp_output_path), factor, drop_frames)
-                succ, msg = action.run()
+            actions = self.get_chained_actions(tmp_output_path, force_reencode)
+            for i, (name, action) in enumerate(actions):
+                action.threads = threads
+                succ, msg = action.run(progress, cancel)
                 if not succ:
-                    return print("SPEEDUP ACTION FAILED\n", msg)
+                    print("{} ACTION FAILED\n".format(name), msg)
+                    return False, msg
+                if i > 0:
+                    # Intermediate files are deleted as soon as the next stage consumed them
+                    os.remove(action.input)
+
+            # Move final video to output path
+            move(actions[-1][1].output, output_path)
+            return True, output_path
+
+    def export_piped(self, output_path, force_reencode=False, threads=None, progress=None, cancel=None):
+        # Same stages as the chained export, streamed through pipes so nothing is written in between
+        actions = self.get_chained_actions("pipe", force_reencode)
+        for i, (_, action) in enumerate(actions):
+            action.threads = threads
+            if i > 0:
+                action.input = "pipe:0"
+            if i < len(actions) - 1:
+                action.output = "pipe:1"
+                action.output_format = PIPE_FORMAT
+        actions[-1][1].output = output_path
+
+        commands = [action.get_command() for _, action in actions]
+        with trace.span("PipedChain", " | ".join(commands), self.video_path, output_path) as event:
+            succ, msg = run_pipeline(commands, progress, cancel, usage=event)
+            event['success'] = succ
+        if not succ:
+            print("PIPED ACTIONS FAILED\n", msg)
+            return False, msg
+        return True, output_path
+
+    async def render_async(self, cache, force_reencode=False, mode='fused', threads=None, progress=None,
+                           timeout=None):
+        video_extension = self.video_path.split('/')[-1].split(".")[-1]
+        key = await run_in_thread(self.get_cache_key, cache, force_reencode, mode)
+        cached_path = cache.get(key, video_extension)
+        if cached_path is not None:
+            return True, cached_path
+
+        tmp_path = cache.reserve(video_extension)
+        try:
+            succ, msg = await self.export_async(tmp_path, force_reencode=force_reencode, mode=mode,
+                                                threads=threads, progress=progress, timeout=timeout)
+        except asyncio.CancelledError:
+            cache.discard(tmp_path)
+            raise
+        if not succ:
+            cache.discard(tmp_path)
+            return False, msg
+        return True, await run_in_thread(cache.commit, tmp_path, key, video_extension)
+
+    async def export_async(self, output_path, force_reencode=False, mode='fused', threads=None, cache=None,
+                           progress=None, timeout=None):
+        """
+        Coroutine version of export. timeout (seconds) applies to each ffmpeg process,
+        cancelling the task kills the running one.
+        """
+        if cache is not None:
+            succ, msg = await self.render_async(cache, force_reencode, mode, threads, progress, timeout)
+            if not succ:
+                return False, msg
+            try:
+                await run_in_thread(copyfile, msg, output_path)
+            finally:
+                cache.release(msg)
+            return True, output_path
+        if mode == 'smart' and not force_reencode and self.is_unmodified():
+            return await self.export_smart_async(output_path, threads, progress, timeout)
+        if mode in ('fused', 'smart'):
+            action = await run_in_thread(self.get_fused_action, output_path, force_reencode, threads)
+            succ, msg = await run_actions_async([("SPLIT PIPELINE", action)], progress, timeout)
+            return (True, output_path) if succ else (False, msg)
+
+        # Piped stages are exported as chained ones, with intermediate files
+        *video_name, _ = self.video_path.split('/')[-1].split(".")
+        with temp_directory() as dir_path:
+            dir_path = dir_path.replace("\\", "/")
+            tmp_output_path = "{}/{}_{}_{}".format(dir_path, ".".join(video_name), self.start_time, self.end_time)
+            actions = await run_in_thread(self.get_chained_actions, tmp_output_path, force_reencode)
+            for _, action in actions:
+                action.threads = threads
+            succ, msg = await run_actions_async([(name + " ACTION", action) for name, action in actions],
+                                                progress, timeout, remove_inputs=True)
+            if not succ:
+                return False, msg
+            await run_in_thread(move, actions[-1][1].output, output_path)
+            return True, output_path
+
+    async def export_smart_async(self, output_path, threads=None, progress=None, timeout=None):
+        index = await run_in_thread(get_seek_keyframes, self.video_path)
+        if index is None or not index.smart_render_encoder:
+            return await self.export_async(output_path, threads=threads, progress=progress, timeout=timeout)
+
+        segments = index.get_segments(self.start_time, self.end_time)
+        if len(segments) == 1:
+            action = await run_in_thread(self.get_smart_cut_action, output_path, index, *segments[0],
+                                         threads=threads)
+            succ, msg = await run_actions_async([("SMART CUT ACTION", action)], progress, timeout)
+            return (True, output_path) if succ else (False, msg)
+
+        with temp_directory() as dir_path:
+            dir_path = dir_path.replace("\\", "/")
+            actions, list_file_path = await run_in_thread(self.get_smart_actions, dir_path, index, segments, threads)
+            succ, msg = await run_actions_async([("SMART CUT ACTION", action) for action in actions],
+                                                timeout=timeout)
+            if not succ:
+                return False, msg
 
-            # Copy final video to output path
-            copyfile(add_extension(tmp_output_path), output_path)
+            succ, msg = await join_video_list_async(list_file_path, output_path, copy=True, timeout=timeout)
+            if not succ:
+                print("JOIN SEGMENTS FAILED\n", msg)
+                return False, msg
+            return True, output_path
 
     def copy(self):
         split_copy = Split(self.video_path, self.start_time, self.end_time)
-        split_copy.config = self.config
+        split_copy.config = deepcopy(self.config)
         return split_copy
 
 
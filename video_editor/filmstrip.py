@@ -0,0 +1,269 @@
+from video_editor._helpers import CANCEL_POLL_INTERVAL, get_ffmpeg_binary, get_file_identity, kill_process
+from video_editor.cache import get_default_cache_dir
+from video_editor.probe import get_media_info
+from subprocess import Popen, PIPE, DEVNULL
+from array import array
+from bisect import bisect_right
+import hashlib
+import json
+import mmap
+import os
+import shlex
+import sys
+import threading
+
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 90
+TILE_SIZE = THUMB_WIDTH * THUMB_HEIGHT * 3
+
+# Seconds between thumbnails for each zoom level
+ZOOM_LEVELS = [1, 4, 16]
+
+WAVEFORM_SAMPLE_RATE = 8000
+PEAKS_PER_SECOND = 100
+PEAK_BUCKET = WAVEFORM_SAMPLE_RATE // PEAKS_PER_SECOND
+
+# Indexers by index directory, reopening a source reuses the one still running
+_indexers = dict()
+_indexers_lock = threading.Lock()
+
+
+def get_index_dir(video_path):
+    key = hashlib.sha1(json.dumps(get_file_identity(video_path)).encode('utf8')).hexdigest()
+    return "{}/{}".format(get_default_cache_dir("filmstrips"), key)
+
+
+class TiledFile:
+
+    """
+    Fixed size records in segment files that may still be growing, read through mmap.
+    A segment is named after the index of its first record and takes over from there,
+    an interrupted index is resumed in a new segment since ffmpeg can't append to a file.
+    """
+
+    def __init__(self, directory, name, record_size):
+        self.directory = directory
+        self.name = name
+        self.record_size = record_size
+        self.segments = []
+        self.maps = dict()
+
+    def get_segment_path(self, first):
+        return "{}/{}.{:08d}".format(self.directory, self.name, first)
+
+    def get_segments(self):
+        # (first record, path) of every segment, in order
+        prefix = self.name + "."
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((int(name[len(prefix):]), "{}/{}".format(self.directory, name))
+                      for name in names if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+    def __len__(self):
+        segments = self.get_segments()
+        if not segments:
+            return 0
+        first, path = segments[-1]
+        try:
+            return first + os.path.getsize(path) // self.record_size
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self, count):
+        # Drops the segments from count on, the next one starts there. Records past count in
+        # earlier segments are hidden by it. Files are removed rather than shrunk, readers
+        # may still have them mapped
+        for first, path in self.get_segments():
+            if first >= count:
+                os.remove(path)
+
+    def find(self, index):
+        i = bisect_right([first for first, _ in self.segments], index) - 1
+        return self.segments[i] if i >= 0 else None
+
+    def get(self, index):
+        if index < 0:
+            return None
+        segment = self.find(index)
+        if segment is None or segment is self.segments[-1]:
+            # New segments may have been started since the last read
+            self.segments = self.get_segments()
+            segment = self.find(index)
+            if segment is None:
+                return None
+
+        first, path = segment
+        end = (index - first + 1) * self.record_size
+        tiles_map = self.maps.get(path)
+        if tiles_map is None or len(tiles_map) < end:
+            # Remap to see the records written since the last read
+            try:
+                if os.path.getsize(path) < end:
+                    return None
+                with open(path, "rb") as tiled_file:
+                    tiles_map = mmap.mmap(tiled_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return None
+            self.maps[path] = tiles_map
+        return tiles_map[end - self.record_size:end]
+
+
+class Filmstrip:
+
+    """
+    Thumbnails at several zoom levels and an audio peak waveform of a source. The index
+    is readable while it's being built, tiles appear as the indexer writes them.
+    """
+
+    def __init__(self, video_path):
+        self.directory = get_index_dir(video_path)
+        self.levels = [TiledFile(self.directory, "level_{}.rgb".format(i), TILE_SIZE)
+                       for i in range(len(ZOOM_LEVELS))]
+        self.peaks = TiledFile(self.directory, "peaks.u8", 1)
+
+    @property
+    def complete(self):
+        return os.path.exists("{}/complete".format(self.directory))
+
+    def get_level(self, seconds_per_thumbnail):
+        # Coarsest level that still has a thumbnail for every displayed one
+        for level in reversed(range(len(ZOOM_LEVELS))):
+            if ZOOM_LEVELS[level] <= seconds_per_thumbnail:
+                return level
+        return 0
+
+    def get_thumbnail(self, level, time):
+        return self.levels[level].get(int(time / 1000 / ZOOM_LEVELS[level]))
+
+    def get_peak(self, time):
+        peak = self.peaks.get(int(time / 1000 * PEAKS_PER_SECOND))
+        return peak[0] / 255 if peak is not None else None
+
+
+def get_indexer(video_path):
+    # The running indexer of a source is shared, a new one resumes where the last one stopped
+    directory = get_index_dir(video_path)
+    with _indexers_lock:
+        indexer = _indexers.get(directory)
+        if indexer is not None and indexer.is_running() and not indexer.cancel.is_set():
+            return indexer
+        _indexers[directory] = FilmstripIndexer(video_path, previous=indexer)
+        return _indexers[directory]
+
+
+class FilmstripIndexer:
+
+    """
+    Builds the filmstrip of a source in a background thread. An index left incomplete is
+    resumed from its last full thumbnail of the coarsest level instead of rebuilt.
+    """
+
+    def __init__(self, video_path, previous=None):
+        self.video_path = video_path
+        self.filmstrip = Filmstrip(video_path)
+        self.cancel = threading.Event()
+        self.thread = None
+        # Indexer of the same source that has to finish before this one starts writing
+        self.previous = previous
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def get_resume_time(self, has_audio):
+        # Seconds already indexed on every level, rounded down to a thumbnail of each level
+        indexed = [len(level) * seconds for level, seconds in zip(self.filmstrip.levels, ZOOM_LEVELS)]
+        if has_audio:
+            indexed.append(len(self.filmstrip.peaks) // PEAKS_PER_SECOND)
+        return min(indexed) // ZOOM_LEVELS[-1] * ZOOM_LEVELS[-1]
+
+    def get_command(self, start=0, has_audio=True):
+        levels = len(ZOOM_LEVELS)
+        graph = "[0:v]scale={}:{},split={}{}".format(THUMB_WIDTH, THUMB_HEIGHT, levels,
+                                                    "".join("[s{}]".format(i) for i in range(levels)))
+        outputs = []
+        for i, seconds in enumerate(ZOOM_LEVELS):
+            graph += ";[s{}]fps=1/{}[l{}]".format(i, seconds, i)
+            path = self.filmstrip.levels[i].get_segment_path(start // seconds)
+            outputs.append('-map "[l{}]" -f rawvideo -pix_fmt rgb24 "{}"'.format(i, path))
+
+        # Audio samples are sent through stdout to compute the peaks, an output without
+        # streams would make ffmpeg fail
+        if has_audio:
+            outputs.append('-map 0:a:0 -ac 1 -ar {} -f s16le pipe:1'.format(WAVEFORM_SAMPLE_RATE))
+
+        return '{ffmpeg} -y -v error -ss {start} -i "{fn}" -filter_complex "{graph}" {outputs}'.format(
+            ffmpeg=get_ffmpeg_binary(),
+            start=start,
+            fn=self.video_path,
+            graph=graph,
+            outputs=" ".join(outputs),
+        )
+
+    def build(self):
+        if self.previous is not None and self.previous.thread is not None:
+            self.previous.stop()
+            self.previous.thread.join()
+        self.previous = None
+        if self.filmstrip.complete or self.cancel.is_set():
+            return self.filmstrip.complete
+        os.makedirs(self.filmstrip.directory, exist_ok=True)
+
+        has_audio = get_media_info(self.video_path).has_audio
+        start = self.get_resume_time(has_audio)
+        for level, seconds in zip(self.filmstrip.levels, ZOOM_LEVELS):
+            level.truncate(start // seconds)
+        self.filmstrip.peaks.truncate(start * PEAKS_PER_SECOND)
+
+        proc = Popen(shlex.split(self.get_command(start, has_audio)), stdout=PIPE, stderr=DEVNULL, stdin=DEVNULL,
+                     start_new_session=(os.name != 'nt'))
+        reaping = threading.Event()
+
+        def watch_cancel():
+            # Reads block until ffmpeg writes, or exits when there's no audio, killing it ends them
+            while not reaping.wait(CANCEL_POLL_INTERVAL):
+                if self.cancel.is_set():
+                    kill_process(proc)
+                    return
+
+        watcher = threading.Thread(target=watch_cancel, daemon=True)
+        watcher.start()
+        chunk_size = PEAK_BUCKET * 2 * PEAKS_PER_SECOND
+        with open(self.filmstrip.peaks.get_segment_path(start * PEAKS_PER_SECOND), "wb") as peaks_file:
+            while not self.cancel.is_set():
+                data = proc.stdout.read(chunk_size)
+                if not data:
+                    break
+                samples = array('h', data[:len(data) - len(data) % 2])
+                if sys.byteorder == 'big':
+                    samples.byteswap()
+                peaks = bytearray()
+                for i in range(0, len(samples), PEAK_BUCKET):
+                    bucket = samples[i:i + PEAK_BUCKET]
+                    peak = max(max(bucket), -min(bucket))
+                    peaks.append(min(255, peak * 255 // 32767))
+                peaks_file.write(peaks)
+                peaks_file.flush()
+
+        if self.cancel.is_set():
+            kill_process(proc)
+        # The watcher stops before the process is reaped, its pid could be reused after
+        reaping.set()
+        watcher.join()
+        proc.wait()
+        proc.stdout.close()
+        if proc.returncode or self.cancel.is_set():
+            return False
+
+        open("{}/complete".format(self.filmstrip.directory), "w").close()
+        return True
+
+    def start(self):
+        # Does nothing if already started
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.build, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.cancel.set()
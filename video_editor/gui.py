@@ -1,21 +1,38 @@
-from PyQt5.QtGui import QFont, QPainter
-from PyQt5.QtCore import Qt, QUrl, QSize
+from PyQt5.QtGui import QFont, QPainter, QImage, QColor, QKeySequence
+from PyQt5.QtCore import Qt, QUrl, QSize, QRect, QTimer, pyqtSignal
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtWidgets import *
 
+from video_editor.analysis import SplitDetector
+from video_editor.cache import RenderCache, get_default_cache_dir
 from video_editor.editor import VideoEditor
+from video_editor.filmstrip import get_indexer, THUMB_WIDTH, THUMB_HEIGHT
+from video_editor.probe import get_media_info
+from video_editor.project import PROJECT_EXTENSION, bind_project, load_project, save_project
+from video_editor.proxy import ProxyManager
+from video_editor.renderqueue import CANCELLED, DONE, FAILED, GUI_STORE, PENDING, RUNNING, JobStore, RenderQueue
+from video_editor.profiles import get_profiles
 import threading
 
 
 class VideoPlayer(QWidget):
 
+    # Emitted from the detection thread, handled in the GUI thread
+    splitPointsDetected = pyqtSignal(list)
+    proxyReady = pyqtSignal(object)
+    statusMessage = pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.videoPath = None
         self.videoDuration = None
         self.videoEditor = None
+        self.filmstripIndexer = None
+        self.proxy = None
+        self.proxyManager = ProxyManager()
+        self.proxyCancel = threading.Event()
 
         # Font
         self.setFont(QFont("Noto Sans", 10))
@@ -52,9 +69,18 @@ class VideoPlayer(QWidget):
         self.timeLabel.setFixedHeight(24)
 
         # Open button
-        openButton = QPushButton("Open Video")
-        openButton.setFixedHeight(24)
-        openButton.clicked.connect(self.loadVideoFile)
+        self.openButton = QPushButton("Open Video")
+        self.openButton.setFixedHeight(24)
+        self.openButton.clicked.connect(self.loadVideoFile)
+
+        # Project buttons
+        self.openProjectButton = QPushButton("Open project")
+        self.openProjectButton.setFixedHeight(24)
+        self.openProjectButton.clicked.connect(self.openProject)
+        self.saveProjectButton = QPushButton("Save project")
+        self.saveProjectButton.setEnabled(False)
+        self.saveProjectButton.setFixedHeight(24)
+        self.saveProjectButton.clicked.connect(self.saveProject)
 
         # Split button
         self.splitButton = QPushButton("Split")
@@ -63,6 +89,20 @@ class VideoPlayer(QWidget):
         self.splitButton.setFixedHeight(24)
         self.splitButton.clicked.connect(self.split)
 
+        # Auto split button
+        self.autoSplitButton = QPushButton("Auto split")
+        self.autoSplitButton.setToolTip("Split on scene changes and silences")
+        self.autoSplitButton.setEnabled(False)
+        self.autoSplitButton.setFixedHeight(24)
+        self.autoSplitButton.clicked.connect(self.autoSplit)
+        self.splitPointsDetected.connect(self.addSplitPoints)
+
+        # Proxy checkbox
+        self.proxyCheckbox = QCheckBox("Use proxy")
+        self.proxyCheckbox.setToolTip("Play a low resolution copy of the video, exports still use the original")
+        self.proxyCheckbox.toggled.connect(self.toggleProxy)
+        self.proxyReady.connect(self.useProxy)
+
         # Export selected button
         self.exportAllButton = QPushButton("Export selected splits")
         self.exportAllButton.setToolTip("Join all selected splits in a single video file")
@@ -70,10 +110,29 @@ class VideoPlayer(QWidget):
         self.exportAllButton.setFixedHeight(24)
         self.exportAllButton.clicked.connect(self.exportVideo)
 
+        # Cancel export button
+        self.cancelButton = QPushButton("Cancel export")
+        self.cancelButton.setEnabled(False)
+        self.cancelButton.setFixedHeight(24)
+        self.cancelButton.clicked.connect(self.cancelExports)
+
+        # Exports run in the background render queue, editing goes on meanwhile
+        self.renderQueue = RenderQueue(JobStore(get_default_cache_dir(GUI_STORE)), concurrency=2)
+        self.renderQueue.start()
+        self.jobs = dict()
+        self.jobsTimer = QTimer(self)
+        self.jobsTimer.timeout.connect(self.updateJobs)
+
+        # Undo and redo shortcuts
+        QShortcut(QKeySequence.Undo, self, self.undo)
+        QShortcut(QKeySequence.Redo, self, self.redo)
+
         # Status bar
         self.statusBar = QStatusBar()
         self.statusBar.setFixedHeight(24)
         self.statusBar.showMessage("Ready")
+        # Background threads report through this signal, widgets are only touched in the GUI thread
+        self.statusMessage.connect(self.statusBar.showMessage)
 
         # Controls layout [open, play and slider]
         controlLayout = QHBoxLayout()
@@ -85,11 +144,19 @@ class VideoPlayer(QWidget):
         # Editor layout [split and export_all]
         editorLayout = QHBoxLayout()
         editorLayout.setContentsMargins(0, 0, 0, 0)
-        editorLayout.addWidget(openButton)
+        editorLayout.addWidget(self.openButton)
+        editorLayout.addWidget(self.openProjectButton)
+        editorLayout.addWidget(self.saveProjectButton)
         editorLayout.addWidget(self.splitButton)
+        editorLayout.addWidget(self.autoSplitButton)
         editorLayout.addWidget(self.exportAllButton)
+        editorLayout.addWidget(self.proxyCheckbox)
+        editorLayout.addWidget(self.cancelButton)
         editorLayout.addStretch(1)
 
+        # Filmstrip
+        self.filmstripWidget = FilmstripWidget()
+
         # Splits layout
         self.splitsLayout = QHBoxLayout()
         self.splitsLayout.setContentsMargins(0, 0, 0, 0)
@@ -100,6 +167,7 @@ class VideoPlayer(QWidget):
         layout.addWidget(videoWidget)
         layout.addLayout(controlLayout)
         layout.addLayout(editorLayout)
+        layout.addWidget(self.filmstripWidget)
         layout.addLayout(self.splitsLayout)
         layout.addWidget(self.statusBar)
         self.setLayout(layout)
@@ -119,34 +187,96 @@ class VideoPlayer(QWidget):
                                                   "Video Files (*.mp4 *.flv *.ts *.mkv *.avi)")
 
         if fileName != '':
-            self.videoPath = fileName
-            self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(fileName)))
-            self.playButton.setEnabled(True)
-            self.splitButton.setEnabled(True)
-            self.exportAllButton.setEnabled(True)
-            self.statusBar.showMessage(fileName)
-            self.togglePlay()
+            self.videoEditor = None
+            # Probe in the background so exports don't wait for it
+            threading.Thread(target=get_media_info, args=(fileName, ), daemon=True).start()
+            self.openMedia(fileName)
+
+    def openMedia(self, fileName):
+        self.videoPath = fileName
+        self.proxy = None
+        self.proxyCancel.set()
+        self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(fileName)))
+        if self.proxyCheckbox.isChecked():
+            self.startProxy()
+        self.playButton.setEnabled(True)
+        self.splitButton.setEnabled(True)
+        self.autoSplitButton.setEnabled(True)
+        self.exportAllButton.setEnabled(True)
+        self.saveProjectButton.setEnabled(True)
+        self.statusBar.showMessage(fileName)
+        self.togglePlay()
+
+    def openProject(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Choose project file", ".",
+                                                  "Projects (*{})".format(PROJECT_EXTENSION))
+        if not fileName:
+            return
+        try:
+            editor, selected = load_project(fileName)
+        except (OSError, ValueError) as e:
+            self.statusBar.showMessage("Error: {}".format(e))
+            return
+
+        # Splits are shown right away, media and probe data are bound afterwards
+        self.videoPath = editor.video_path
+        self.videoDuration = editor.video_length
+        self.positionSlider.setRange(0, editor.video_length)
+        self.setEditor(editor, selected)
+        bind_project(editor)
+        self.openMedia(editor.video_path)
+
+    def saveProject(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, "Choose project file", ".",
+                                                  "Projects (*{})".format(PROJECT_EXTENSION))
+        if fileName:
+            if not fileName.endswith(PROJECT_EXTENSION):
+                fileName += PROJECT_EXTENSION
+            selected = [splitWgt.splitId for splitWgt in self.getSplitWidgets() if splitWgt.marked]
+            save_project(fileName, self.videoEditor, selected)
+            self.statusBar.showMessage("Saved " + fileName)
 
     def getSplitWidgets(self):
         for i in range(self.splitsLayout.count()):
             yield self.splitsLayout.itemAt(i).widget()
 
     def updateSplitsGUI(self):
-        oldWidgets = list(self.getSplitWidgets())
+        # Old widgets leave the layout first, so the indexes below are the new ones
+        for widget in list(self.getSplitWidgets()):
+            widget.setParent(None)
 
-        splitTimes = []
         for i, split in enumerate(self.videoEditor.get_splits()):
-            splitWgt = SplitWidget(self, i)
-            splitWgt.setToolTip("{} - {}".format(self.positionToString(split.start_time),
-                                                 self.positionToString(split.end_time)))
+            splitWgt = SplitWidget(self)
             splitWgt.setMinimumWidth(4)
             self.splitsLayout.addWidget(splitWgt, split.duration)
-            splitTimes.append(split.start_time)
+            self.updateSplitWidget(i)
 
-        for widget in oldWidgets:
-            widget.setParent(None)
+        # The start times list is kept up to date by the editor
+        self.positionSlider.splitValues = self.videoEditor.get_splits().starts
+        self.positionSlider.update()
 
-        self.positionSlider.splitValues = splitTimes
+    def updateSplitWidget(self, splitId):
+        split = self.videoEditor.get_splits()[splitId]
+        splitWgt = self.splitsLayout.itemAt(splitId).widget()
+        splitWgt.setToolTip("{} - {}".format(self.positionToString(split.start_time),
+                                             self.positionToString(split.end_time)))
+        self.splitsLayout.setStretch(splitId, split.duration)
+
+    def splitsChanged(self, event, splitId):
+        # Patches the widgets affected by an edit instead of rebuilding the whole row
+        if event == 'insert':
+            # The new split comes from the one now following it, it keeps its selection
+            marked = self.splitsLayout.itemAt(splitId).widget().marked
+            splitWgt = SplitWidget(self, marked)
+            splitWgt.setMinimumWidth(4)
+            self.splitsLayout.insertWidget(splitId, splitWgt)
+            self.updateSplitWidget(splitId)
+        elif event == 'remove':
+            self.splitsLayout.itemAt(splitId).widget().setParent(None)
+        elif event == 'update':
+            self.updateSplitWidget(splitId)
+        else:
+            self.updateSplitsGUI()
         self.positionSlider.update()
 
     def exportVideo(self):
@@ -164,15 +294,56 @@ class VideoPlayer(QWidget):
         fileName, _ = QFileDialog.getSaveFileName(self, "Choose video file", ".",
                                                   "Video Files (*.{})".format(videoExtension))
         if fileName:
-            t = threading.Thread(target=self.generateVideo, args=(splitIds, fileName))
-            t.setDaemon(True)
-            t.start()
-
-    def generateVideo(self, splitIds, filename):
-        self.setDisabled(True)
-        self.mediaPlayer.pause()
-        self.videoEditor.export_and_join_splits(splitIds, filename)
-        self.setDisabled(False)
+            self.submitJob(self.renderQueue.submit(self.videoEditor, splitIds, fileName))
+
+    def submitJob(self, jobId):
+        self.jobs[jobId] = PENDING
+        self.cancelButton.setEnabled(True)
+        self.jobsTimer.start(500)
+        self.updateJobs()
+
+    def updateJobs(self):
+        # Polls the job store, only jobs submitted from this window are shown
+        active = []
+        for job in self.renderQueue.store.list():
+            if job['id'] not in self.jobs:
+                continue
+            if job['status'] != self.jobs[job['id']]:
+                self.jobs[job['id']] = job['status']
+                if job['status'] == DONE:
+                    self.statusBar.showMessage("Exported " + job['output'])
+                elif job['status'] == FAILED:
+                    self.statusBar.showMessage("Export failed: " + job['message'])
+                elif job['status'] == CANCELLED:
+                    self.statusBar.showMessage("Export cancelled: " + job['output'])
+            if job['status'] in (PENDING, RUNNING):
+                active.append(job)
+
+        running = [job for job in active if job['status'] == RUNNING]
+        if running:
+            self.statusBar.showMessage("Exporting {} ({}%), {} more queued".format(
+                running[0]['output'], int(running[0]['progress'] * 100), len(active) - 1))
+
+        # Splits being exported show their progress instead of their mark
+        splitsProgress = dict()
+        for job in running:
+            splitsProgress.update(self.renderQueue.get_split_progress(job['id']))
+        splits = self.videoEditor.get_splits() if self.videoEditor is not None else []
+        for splitWgt, split in zip(self.getSplitWidgets(), splits):
+            fraction = splitsProgress.get((split.start_time, split.end_time))
+            if fraction is None:
+                splitWgt.showMark()
+            else:
+                splitWgt.showProgress(fraction)
+        if not active:
+            self.jobsTimer.stop()
+        self.cancelButton.setEnabled(bool(active))
+
+    def cancelExports(self):
+        for jobId, status in self.jobs.items():
+            if status in (PENDING, RUNNING):
+                self.renderQueue.cancel(jobId)
+        self.updateJobs()
 
     def togglePlay(self):
         if self.mediaPlayer.state() == QMediaPlayer.PlayingState:
@@ -195,9 +366,30 @@ class VideoPlayer(QWidget):
         # Triggers when a video is loaded
         self.positionSlider.setRange(0, duration)
         self.timeLabel.setText("00:00")
+        if self.videoEditor is not None and self.videoEditor.video_path == self.videoPath:
+            # Editor already restored from a project
+            return
         self.videoDuration = duration
-        self.videoEditor = VideoEditor(self.videoPath, self.videoDuration)
+        self.setEditor(VideoEditor(self.videoPath, self.videoDuration))
+
+    def setEditor(self, editor, selected=None):
+        self.videoEditor = editor
+        self.videoEditor.render_cache = RenderCache()
+        self.videoEditor.add_listener(self.splitsChanged)
+        self.indexFilmstrip()
         self.updateSplitsGUI()
+        if selected is not None:
+            for splitWgt in self.getSplitWidgets():
+                splitWgt.marked = splitWgt.splitId in selected
+                splitWgt.showMark()
+
+    def indexFilmstrip(self):
+        indexer = get_indexer(self.videoPath)
+        if self.filmstripIndexer is not None and self.filmstripIndexer is not indexer:
+            self.filmstripIndexer.stop()
+        self.filmstripIndexer = indexer
+        self.filmstripIndexer.start()
+        self.filmstripWidget.setSource(self.filmstripIndexer.filmstrip, self.videoDuration)
 
     def setPosition(self, position):
         # Slider setPosition event, updates media player and timer
@@ -206,14 +398,84 @@ class VideoPlayer(QWidget):
         if position < self.positionSlider.maximum() and self.mediaPlayer.state() != QMediaPlayer.PlayingState:
             self.mediaPlayer.play()
 
+    def switchMedia(self, fileName):
+        # Keeps position and play state, both files share the timeline
+        position = self.mediaPlayer.position()
+        playing = self.mediaPlayer.state() == QMediaPlayer.PlayingState
+        self.mediaPlayer.setMedia(QMediaContent(QUrl.fromLocalFile(fileName)))
+        self.mediaPlayer.setPosition(position)
+        if playing:
+            self.mediaPlayer.play()
+
+    def toggleProxy(self, checked):
+        if self.videoPath is None:
+            return
+        if checked:
+            self.startProxy()
+        else:
+            self.proxyCancel.set()
+            if self.proxy is not None:
+                self.proxy = None
+                self.switchMedia(self.videoPath)
+
+    def startProxy(self):
+        self.proxyCancel = threading.Event()
+
+        def progress(event):
+            if event['out_time'] is not None:
+                position = self.positionToString(int(event['out_time'] * 1000))
+                self.statusMessage.emit("Generating proxy: {}".format(position))
+
+        def done(succ, proxy):
+            self.proxyReady.emit(proxy if succ else None)
+
+        self.proxyManager.start(self.videoPath, done, progress=progress, cancel=self.proxyCancel)
+
+    def useProxy(self, proxy):
+        # Results for another file or after unchecking are dropped
+        if proxy is None or proxy.source_path != self.videoPath or not self.proxyCheckbox.isChecked():
+            return
+        self.proxy = proxy
+        self.switchMedia(proxy.path)
+        self.statusBar.showMessage("Playing proxy of " + self.videoPath)
+
     def split(self):
         time = self.positionSlider.value()
+        if self.proxy is not None:
+            time = self.proxy.to_source_time(time)
         self.videoEditor.add_split(time)
-        self.updateSplitsGUI()
+
+    def undo(self):
+        if self.videoEditor is not None and not self.videoEditor.undo():
+            self.statusBar.showMessage("Nothing to undo")
+
+    def redo(self):
+        if self.videoEditor is not None and not self.videoEditor.redo():
+            self.statusBar.showMessage("Nothing to redo")
+
+    def autoSplit(self):
+        self.autoSplitButton.setEnabled(False)
+        self.statusBar.showMessage("Detecting scene changes and silences...")
+        threading.Thread(target=self.detectSplitPoints, args=(self.videoPath, ), daemon=True).start()
+
+    def detectSplitPoints(self, videoPath):
+        def progress(event):
+            if event['out_time'] is not None:
+                position = self.positionToString(int(event['out_time'] * 1000))
+                self.statusMessage.emit("Detecting scene changes and silences: {}".format(position))
+
+        succ, points = SplitDetector(videoPath).detect(progress=progress)
+        self.splitPointsDetected.emit(points if succ else [])
+
+    def addSplitPoints(self, points):
+        added = self.videoEditor.add_splits(points)
+        self.statusBar.showMessage("Added {} splits".format(added))
+        self.autoSplitButton.setEnabled(True)
 
     def handleError(self):
         self.playButton.setEnabled(False)
         self.splitButton.setEnabled(False)
+        self.autoSplitButton.setEnabled(False)
         self.exportAllButton.setEnabled(False)
         self.statusBar.showMessage("Error: " + self.mediaPlayer.errorString())
 
@@ -247,20 +509,76 @@ class QSliderMarker(QSlider):
             painter.drawLine(px, 0, px, 200)
 
 
+class FilmstripWidget(QWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filmstrip = None
+        self.duration = 0
+        self.setFixedHeight(36)
+
+        # Repaint while the filmstrip is being indexed
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def setSource(self, filmstrip, duration):
+        self.filmstrip = filmstrip
+        self.duration = duration
+        self.refreshTimer.start(1000)
+        self.update()
+
+    def refresh(self):
+        self.update()
+        if self.filmstrip.complete:
+            self.refreshTimer.stop()
+
+    def paintEvent(self, event):
+        if self.filmstrip is None or not self.duration or not self.width():
+            return
+
+        painter = QPainter(self)
+        height = self.height()
+        thumbWidth = height * THUMB_WIDTH // THUMB_HEIGHT
+        level = self.filmstrip.get_level(self.duration / 1000 * thumbWidth / self.width())
+        for x in range(0, self.width(), thumbWidth):
+            data = self.filmstrip.get_thumbnail(level, x * self.duration / self.width())
+            if data is None:
+                break
+            image = QImage(data, THUMB_WIDTH, THUMB_HEIGHT, THUMB_WIDTH * 3, QImage.Format_RGB888)
+            painter.drawImage(QRect(x, 0, thumbWidth, height), image)
+
+        painter.setPen(QColor(120, 220, 140))
+        for x in range(self.width()):
+            peak = self.filmstrip.get_peak(x * self.duration / self.width())
+            if peak is None:
+                break
+            half = int(peak * height / 2)
+            painter.drawLine(x, height // 2 - half, x, height // 2 + half)
+
+
 class SplitWidget(QPushButton):
 
-    def __init__(self, parent, splitId):
+    def __init__(self, parent, marked=True):
         super().__init__(parent)
-        self.marked = False
+        self.marked = not marked
         self.textOptions = ['✗', '✓']
-        self.splitId = splitId
         self.toggleMark()
 
+    @property
+    def splitId(self):
+        return self.parent().splitsLayout.indexOf(self)
+
     def toggleMark(self):
         self.marked ^= True
+        self.showMark()
+
+    def showMark(self):
         newText = self.textOptions[int(self.marked)]
         self.setText(newText)
 
+    def showProgress(self, fraction):
+        self.setText("{}%".format(min(99, int(fraction * 100))))
+
     def contextMenuEvent(self, event):
         menu = QMenu(self)
         rightMerge, leftMerge = object(), object()
@@ -274,32 +592,21 @@ class SplitWidget(QPushButton):
         action = menu.exec_(self.mapToGlobal(event.pos()))
         if action == rightMerge:
             self.parent().videoEditor.merge_split_with_next(self.splitId)
-            self.parent().updateSplitsGUI()
         elif action == leftMerge:
             self.parent().videoEditor.merge_split_with_previous(self.splitId)
-            self.parent().updateSplitsGUI()
         if action == save:
             videoExtension = self.parent().videoPath.split(".")[-1]
             fileName, _ = QFileDialog.getSaveFileName(self, "Choose video file", ".",
                                                       "Video Files (*.{})".format(videoExtension))
             if fileName:
-                t = threading.Thread(target=self.exportSplit, args=(fileName, ))
-                t.setDaemon(True)
-                t.start()
+                parent = self.parent()
+                parent.submitJob(parent.renderQueue.submit_split(parent.videoEditor, self.splitId, fileName))
 
         elif action == mark:
             self.toggleMark()
         elif action == edit:
             self.parent().openEditWindow(self.splitId)
 
-    def exportSplit(self, filename):
-        self.setDisabled(True)
-        self.setText('⌛')
-        self.parent().videoEditor.export_split(self.splitId, filename)
-        textStatus = self.textOptions[int(self.marked)]
-        self.setText(textStatus)
-        self.setDisabled(False)
-
 
 class EditWidget(QDialog):
 
@@ -308,6 +615,7 @@ class EditWidget(QDialog):
 
         self.setWindowTitle("Edit split")
         self.splitId = None
+        self.speedupCurve = None
 
         # Reencode layout
         self.reencodeCheckbox = QCheckBox("Reencode")
@@ -323,9 +631,22 @@ class EditWidget(QDialog):
         self.compressCheckbox.setToolTip("Check this option to compress video and audio quality "
                                          "and reduce the output file size")
 
+        compressLayoutOpt = QHBoxLayout()
+        self.profileCombo = QComboBox()
+        self.profileCombo.addItems(["Default"] + sorted(get_profiles()))
+        profileLabel = QLabel("Profile:")
+        profileLabel.setToolTip("Encoder profile, trades encoding speed for quality")
+        compressLayoutOpt.addItem(QSpacerItem(25, 0, QSizePolicy.Minimum, QSizePolicy.Minimum))
+        compressLayoutOpt.addWidget(profileLabel)
+        compressLayoutOpt.addWidget(self.profileCombo)
+        # Profiles only apply to compressed splits
+        self.profileCombo.setEnabled(False)
+        self.compressCheckbox.toggled.connect(self.profileCombo.setEnabled)
+
         compressLayout = QVBoxLayout()
         compressLayout.setContentsMargins(0, 0, 0, 0)
         compressLayout.addWidget(self.compressCheckbox)
+        compressLayout.addLayout(compressLayoutOpt)
 
         # Audio layout
         self.removeAudioCheckbox = QCheckBox("Remove audio")
@@ -373,16 +694,21 @@ class EditWidget(QDialog):
         self.splitId = splitId
         self.reencodeCheckbox.setChecked(config.get('reencode', False))
         self.compressCheckbox.setChecked(config.get('compress', False))
+        self.profileCombo.setCurrentText(config.get('profile') or "Default")
         self.removeAudioCheckbox.setChecked(config.get('removeaudio', False))
         speedupSettings = config.get('speedup')
         if speedupSettings:
             self.speedupCheckbox.setChecked(True)
             self.speedupFactor.setValue(config['speedup'].get('factor', 1))
             self.keepFramesCheckbox.setChecked(not config['speedup'].get('dropframes', True))
+            # Speed ramps can't be edited here, they are kept as they are
+            self.speedupCurve = config['speedup'].get('curve')
         else:
             self.speedupCheckbox.setChecked(False)
             self.speedupFactor.setValue(1)
             self.keepFramesCheckbox.setChecked(False)
+            self.speedupCurve = None
+        self.speedupFactor.setDisabled(bool(self.speedupCurve))
 
     def getSplitConfig(self):
         speedup = False
@@ -391,17 +717,24 @@ class EditWidget(QDialog):
                 'factor': self.speedupFactor.value(),
                 'dropframes': not self.keepFramesCheckbox.isChecked(),
             }
+            if self.speedupCurve:
+                speedup['curve'] = self.speedupCurve
 
+        compress = self.compressCheckbox.isChecked()
         return {
             'reencode': self.reencodeCheckbox.isChecked(),
-            'compress': self.compressCheckbox.isChecked(),
+            'compress': compress,
+            'profile': self.profileCombo.currentText() if compress and self.profileCombo.currentIndex() else None,
             'removeaudio': self.removeAudioCheckbox.isChecked(),
             'speedup': speedup
         }
 
     def saveConfig(self):
         config = self.getSplitConfig()
-        self.parent().videoEditor.update_split(self.splitId, config)
+        try:
+            self.parent().videoEditor.update_split(self.splitId, config)
+        except ValueError as e:
+            self.parent().statusBar.showMessage("Split not updated: {}".format(e))
 
     def reject(self):
         self.saveConfig()
@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+# Snapshots are split into chunks of about this many splits, unchanged chunks are shared
+CHUNK_SIZE = 64
+
+DEFAULT_HISTORY_LIMIT = 10000
+
+SplitState = namedtuple('SplitState', ['start_time', 'end_time', 'config'])
+
+
+def freeze(value):
+    # Immutable and hashable copy of a config
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ('__list__', tuple(freeze(item) for item in value))
+    return value
+
+
+def freeze_config(config):
+    # Frozen config without the options left at their default, unset, False and None are the same
+    return freeze({key: value for key, value in config.items() if value is not None and value is not False})
+
+
+def thaw(value):
+    if isinstance(value, tuple):
+        if len(value) == 2 and value[0] == '__list__':
+            return [thaw(item) for item in value[1]]
+        return {key: thaw(item) for key, item in value}
+    return value
+
+
+class Snapshot:
+
+    """
+    Immutable state of every split, in chunks of up to 2 * CHUNK_SIZE splits. The next
+    snapshot of an edit is built with replace, which rebuilds the chunks touching the
+    edited range and shares every other chunk, so an undo step costs about one chunk plus
+    the chunk index.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.length = sum(len(chunk) for chunk in chunks)
+
+    @classmethod
+    def build(cls, states):
+        states = tuple(states)
+        return cls(tuple(states[i:i + CHUNK_SIZE] for i in range(0, len(states), CHUNK_SIZE)))
+
+    def replace(self, start, stop, states):
+        # Snapshot with the split states in [start, stop) replaced by states
+        k, offset = 0, 0
+        while k < len(self.chunks) - 1 and offset + len(self.chunks[k]) <= start:
+            offset += len(self.chunks[k])
+            k += 1
+        end, end_offset = k, offset
+        while end < len(self.chunks) and (end == k or end_offset < stop):
+            end_offset += len(self.chunks[end])
+            end += 1
+
+        edited = sum(self.chunks[k:end], ())
+        edited = edited[:start - offset] + tuple(states) + edited[stop - offset:]
+        size = CHUNK_SIZE if len(edited) > 2 * CHUNK_SIZE else max(1, len(edited))
+        rebuilt = tuple(edited[i:i + size] for i in range(0, len(edited), size))
+        return Snapshot(self.chunks[:k] + rebuilt + self.chunks[end:])
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+
+def diff(old, new):
+    """
+    Returns (removed, added) split states between two snapshots. Chunks shared by both
+    are skipped without looking at their splits.
+    """
+    shared = set(map(id, old.chunks)) & set(map(id, new.chunks))
+    old_states, new_states = set(), set()
+    for chunk in old.chunks:
+        if id(chunk) not in shared:
+            old_states.update(chunk)
+    for chunk in new.chunks:
+        if id(chunk) not in shared:
+            new_states.update(chunk)
+    return old_states - new_states, new_states - old_states
+
+
+class History:
+
+    def __init__(self, snapshot, limit=DEFAULT_HISTORY_LIMIT):
+        self.current = snapshot
+        self.limit = limit
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def push(self, snapshot):
+        self.undo_stack.append(self.current)
+        if len(self.undo_stack) > self.limit:
+            del self.undo_stack[0]
+        self.redo_stack = []
+        self.current = snapshot
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        self.redo_stack.append(self.current)
+        self.current = self.undo_stack.pop()
+        return self.current
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        self.undo_stack.append(self.current)
+        self.current = self.redo_stack.pop()
+        return self.current
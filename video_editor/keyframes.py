@@ -0,0 +1,167 @@
+from video_editor._helpers import get_ffprobe_binary, get_file_identity, run_command
+from video_editor.probe import get_probe_index
+from bisect import bisect_left, bisect_right
+import threading
+
+# Max distance (ms) between a split boundary and a keyframe to consider them aligned
+KEYFRAME_TOLERANCE = 10
+
+# Encoders able to produce streams that can be concatenated with the copied ones
+SMART_RENDER_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+    'mpeg4': 'mpeg4',
+    'vp9': 'libvpx-vp9',
+}
+
+# ffprobe profile names of the encoders above, the edges have to match the copied GOPs
+ENCODER_PROFILES = {
+    'libx264': {
+        'Baseline': 'baseline',
+        'Constrained Baseline': 'baseline',
+        'Main': 'main',
+        'High': 'high',
+        'High 10': 'high10',
+        'High 4:2:2': 'high422',
+        'High 4:4:4 Predictive': 'high444',
+    },
+    'libx265': {
+        'Main': 'main',
+        'Main 10': 'main10',
+        'Main 12': 'main12',
+        'Rext': 'main444-8',
+    },
+}
+
+# ffprobe reports levels as level_idc, e.g. 41 for 4.1 in H.264 and 123 for 4.1 in HEVC
+LEVEL_SCALES = {'libx264': 10, 'libx265': 30}
+
+# Containers taking the track time base of the copied stream
+TIMESCALE_EXTENSIONS = ('mp4', 'mov', 'm4v')
+
+_cache = dict()
+_cache_lock = threading.Lock()
+
+
+class KeyframeIndex:
+
+    def __init__(self, keyframes, duration, codec=None, stream=None):
+        self.keyframes = keyframes
+        self.duration = duration
+        self.codec = codec
+        # Coding parameters of the video stream: profile, level, pix_fmt and time_base
+        self.stream = stream or dict()
+
+    @classmethod
+    def from_file(cls, video_path):
+        cmd = '{ffprobe} -v error -select_streams v:0 -show_entries ' \
+              'stream=codec_name,profile,level,pix_fmt,time_base:packet=pts_time,flags:format=duration ' \
+              '-of csv=nokey=0 "{fn}"'.format(ffprobe=get_ffprobe_binary(), fn=video_path)
+        succ, out = run_command(cmd)
+        if not succ:
+            raise SystemError("Could not read keyframes of {}\n{}".format(video_path, out))
+
+        keyframes, duration, stream = [], 0, dict()
+        for line in out.splitlines():
+            section, *fields = line.split(",")
+            values = dict(field.split("=", 1) for field in fields if "=" in field)
+            if section == "packet" and "K" in values.get('flags', "") and values.get('pts_time', "N/A") != "N/A":
+                keyframes.append(float(values['pts_time']) * 1000)
+            elif section == "stream":
+                stream = {key: value for key, value in values.items() if value not in ("", "N/A", "unknown")}
+            elif section == "format" and values.get('duration', "N/A") != "N/A":
+                duration = float(values['duration']) * 1000
+
+        return cls(sorted(keyframes), duration, stream.pop('codec_name', None), stream)
+
+    @property
+    def smart_render_encoder(self):
+        return SMART_RENDER_ENCODERS.get(self.codec)
+
+    def get_smart_render_args(self, output_path):
+        # Encoder options making the reencoded edges match the copied stream
+        encoder = self.smart_render_encoder
+        args = []
+        profile = ENCODER_PROFILES.get(encoder, dict()).get(self.stream.get('profile'))
+        if profile:
+            args.append("-profile:v {}".format(profile))
+        level = self.stream.get('level')
+        if encoder in LEVEL_SCALES and level and level.isdigit() and int(level) > 0:
+            level = "{:.1f}".format(int(level) / LEVEL_SCALES[encoder])
+            if encoder == 'libx264':
+                args.append("-level:v {}".format(level))
+            else:
+                args.append("-x265-params level-idc={}".format(level))
+        if self.stream.get('pix_fmt'):
+            args.append("-pix_fmt {}".format(self.stream['pix_fmt']))
+        time_base = self.stream.get('time_base', "")
+        if output_path.split(".")[-1].lower() in TIMESCALE_EXTENSIONS and time_base.startswith("1/"):
+            args.append("-video_track_timescale {}".format(time_base[2:]))
+        return args
+
+    def align(self, time):
+        # The keyframe time within the tolerance of time, time itself at the ends, or None
+        if time <= 0 or time >= self.duration - KEYFRAME_TOLERANCE:
+            return time
+        i = bisect_left(self.keyframes, time - KEYFRAME_TOLERANCE)
+        if i < len(self.keyframes) and self.keyframes[i] <= time + KEYFRAME_TOLERANCE:
+            return self.keyframes[i]
+        return None
+
+    def is_aligned(self, time):
+        return self.align(time) is not None
+
+    def next_keyframe(self, time):
+        i = bisect_left(self.keyframes, time)
+        return self.keyframes[i] if i < len(self.keyframes) else None
+
+    def previous_keyframe(self, time):
+        i = bisect_right(self.keyframes, time)
+        return self.keyframes[i - 1] if i else None
+
+    def to_dict(self):
+        return {'keyframes': self.keyframes, 'duration': self.duration, 'codec': self.codec, 'stream': self.stream}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['keyframes'], data['duration'], data['codec'], data['stream'])
+
+    def get_segments(self, start_time, end_time):
+        # Returns a list of (start, end, reencode) covering the interval, copying whole GOPs only
+        if self.is_aligned(start_time) and self.is_aligned(end_time):
+            return [(start_time, end_time, False)]
+
+        # Copied segments start and end exactly at keyframes
+        first = self.align(start_time)
+        if first is None:
+            first = self.next_keyframe(start_time)
+        last = self.align(end_time)
+        if last is None:
+            last = self.previous_keyframe(end_time)
+        if first is None or last is None or first >= last:
+            return [(start_time, end_time, True)]
+
+        segments = []
+        if first > start_time:
+            segments.append((start_time, first, True))
+        segments.append((first, last, False))
+        if last < end_time:
+            segments.append((last, end_time, True))
+        return segments
+
+
+def get_keyframe_index(video_path):
+    key = get_file_identity(video_path)
+    with _cache_lock:
+        index = _cache.get(key)
+    if index is None:
+        data = get_probe_index().get('keyframes', video_path)
+        # Entries stored before the stream parameters were probed are read again
+        if data is not None and 'stream' in data:
+            index = KeyframeIndex.from_dict(data)
+        else:
+            index = KeyframeIndex.from_file(video_path)
+            get_probe_index().put('keyframes', video_path, index.to_dict())
+        with _cache_lock:
+            _cache[key] = index
+    return index
@@ -0,0 +1,153 @@
+from video_editor._helpers import get_ffmpeg_binary
+from video_editor.actions import BaseAction, get_seek_args
+from video_editor.profiles import get_config_profile, get_profile_args
+from video_editor.speed import SpeedCurve
+
+
+def get_video_filters(config):
+    filters = []
+    curve = SpeedCurve.from_config(config)
+    if curve is not None:
+        filters.append(curve.get_video_filter())
+    return filters
+
+
+def get_audio_filters(config, label="sp"):
+    # label names the pads of a speed ramp, it has to be unique in a filter graph
+    filters = []
+    if config.get('removeaudio', False):
+        filters.append("volume=0")
+    curve = SpeedCurve.from_config(config)
+    if curve is not None:
+        filters.append(curve.get_audio_filter(label))
+    return filters
+
+
+def get_encoder_args(config):
+    # Encoder settings for a reencoded split, None when ffmpeg defaults are used
+    profile = get_config_profile(config)
+    if profile:
+        return get_profile_args(profile)
+    if config.get('compress', False):
+        return ["-vcodec h264", "-acodec aac"]
+    return None
+
+
+class SplitPipeline(BaseAction):
+
+    """
+    Compiles a split config into a single ffmpeg invocation, so the cut, compress,
+    remove audio and speedup steps share one decode and one encode.
+    """
+
+    def __init__(self, input_path, output_path, start_time, end_time, config, force_reencode=False,
+                 has_audio=True, seek='input', keyframes=None):
+        super().__init__(input_path, output_path)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.config = config
+        self.force_reencode = force_reencode
+        self.has_audio = has_audio
+        self.seek = seek
+        self.keyframes = keyframes
+
+    def get_codec_args(self, video_filters, audio_filters):
+        reencode = self.force_reencode or self.config.get('reencode', False)
+        encoder_args = get_encoder_args(self.config)
+        if encoder_args is not None:
+            return encoder_args
+
+        args = []
+        if not video_filters and not reencode:
+            args.append("-c:v copy")
+        if not audio_filters and not reencode:
+            args.append("-c:a copy")
+        return args
+
+    def get_command(self):
+        video_filters = get_video_filters(self.config)
+        audio_filters = get_audio_filters(self.config) if self.has_audio else []
+
+        args = []
+        if video_filters:
+            args.append('-filter:v "{}"'.format(",".join(video_filters)))
+        if audio_filters:
+            args.append('-filter:a "{}"'.format(",".join(audio_filters)))
+        codec_args = self.get_codec_args(video_filters, audio_filters)
+        args.extend(codec_args)
+        if self.threads_arg:
+            args.append(self.threads_arg)
+
+        # The pre-roll dropped by hybrid seeking is only known in output time for a constant speed
+        curve = SpeedCurve.from_config(self.config)
+        ramped = curve is not None and not curve.is_constant
+        seek = 'input' if "-c:v copy" in codec_args or ramped else self.seek
+        input_seek, output_seek = get_seek_args(self.start_time, self.end_time, seek, self.keyframes,
+                                                curve.speeds[0] if curve is not None else 1)
+        return '{ffmpeg} -y {ss} -i "{fn}" {oss} -async 1 {args} "{o}"'.format(
+            ffmpeg=get_ffmpeg_binary(),
+            fn=self.input,
+            ss=input_seek,
+            oss=output_seek,
+            args=" ".join(args),
+            o=self.output,
+        )
+
+
+class TimelinePipeline(BaseAction):
+
+    """
+    Renders a list of (start_time, end_time, config) segments of the input, joined in
+    order, with a single filter graph: the source is read once and nothing is written
+    to disk but the output. Decoding starts at the keyframe before the first segment.
+    """
+
+    def __init__(self, input_path, output_path, segments, has_audio=True, keyframes=None):
+        super().__init__(input_path, output_path)
+        self.segments = segments
+        self.has_audio = has_audio
+        self.keyframes = keyframes
+
+    @property
+    def seek_time(self):
+        # Input seek position, trims are relative to it
+        start_time = min(start_time for start_time, _, _ in self.segments)
+        keyframe = self.keyframes.previous_keyframe(start_time) if self.keyframes else None
+        return keyframe if keyframe is not None else start_time
+
+    def get_complex_filter(self):
+        count = len(self.segments)
+        graph = ["[0:v]split={}{}".format(count, "".join("[vs{}]".format(i) for i in range(count)))]
+        if self.has_audio:
+            graph.append("[0:a]asplit={}{}".format(count, "".join("[as{}]".format(i) for i in range(count))))
+
+        outputs = []
+        offset = self.seek_time
+        for i, (start_time, end_time, config) in enumerate(self.segments):
+            trim = "start={:.3f}:end={:.3f}".format((start_time - offset) / 1000, (end_time - offset) / 1000)
+            video = ["trim=" + trim, "setpts=PTS-STARTPTS"] + get_video_filters(config)
+            graph.append("[vs{}]{}[v{}]".format(i, ",".join(video), i))
+            outputs.append("[v{}]".format(i))
+            if self.has_audio:
+                audio = ["atrim=" + trim, "asetpts=PTS-STARTPTS"] + get_audio_filters(config, "sp{}".format(i))
+                graph.append("[as{}]{}[a{}]".format(i, ",".join(audio), i))
+                outputs.append("[a{}]".format(i))
+
+        graph.append("{}concat=n={}:v=1:a={}[v]{}".format(
+            "".join(outputs), count, int(self.has_audio), "[a]" if self.has_audio else ""))
+        return ";".join(graph)
+
+    def get_command(self):
+        maps = '-map "[v]" -map "[a]"' if self.has_audio else '-map "[v]"'
+        # Every segment shares the output encoder, segments are checked to agree on it
+        encoder_args = get_encoder_args(self.segments[0][2]) or []
+        return '{ffmpeg} -y -ss {ss:.3f} -i "{fn}" -filter_complex "{filter}" {maps} {codec} {th} "{o}"'.format(
+            ffmpeg=get_ffmpeg_binary(),
+            ss=self.seek_time / 1000,
+            fn=self.input,
+            filter=self.get_complex_filter(),
+            maps=maps,
+            codec=" ".join(encoder_args),
+            th=self.threads_arg,
+            o=self.output,
+        )
@@ -0,0 +1,165 @@
+from video_editor._helpers import get_ffprobe_binary, get_file_identity, run_command
+from video_editor.cache import get_default_cache_dir
+from collections import namedtuple
+import json
+import os
+import sqlite3
+import threading
+
+StreamInfo = namedtuple('StreamInfo', ['index', 'codec_type', 'codec_name', 'width', 'height', 'frame_rate',
+                                       'sample_rate', 'channels', 'bit_rate'])
+
+
+class MediaInfo(namedtuple('MediaInfo', ['duration', 'format_name', 'size', 'bit_rate', 'streams'])):
+
+    """
+    Compact description of a source, times in milliseconds and bit rates in bits/s.
+    """
+
+    def get_streams(self, codec_type):
+        return [stream for stream in self.streams if stream.codec_type == codec_type]
+
+    @property
+    def video_stream(self):
+        streams = self.get_streams('video')
+        return streams[0] if streams else None
+
+    @property
+    def has_video(self):
+        return self.video_stream is not None
+
+    @property
+    def has_audio(self):
+        return bool(self.get_streams('audio'))
+
+    @property
+    def frame_rate(self):
+        return self.video_stream.frame_rate if self.has_video else None
+
+    def to_dict(self):
+        return dict(self._asdict(), streams=[stream._asdict() for stream in self.streams])
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict(data, streams=[StreamInfo(**stream) for stream in data['streams']]))
+
+
+def parse_rate(rate):
+    # ffprobe rates are fractions, e.g. "30000/1001"
+    num, _, den = (rate or "0/0").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ffprobe(output):
+    data = json.loads(output)
+    fmt = data.get('format', dict())
+    streams = [StreamInfo(
+        index=stream['index'],
+        codec_type=stream.get('codec_type'),
+        codec_name=stream.get('codec_name'),
+        width=stream.get('width'),
+        height=stream.get('height'),
+        frame_rate=parse_rate(stream.get('avg_frame_rate')) if stream.get('codec_type') == 'video' else None,
+        sample_rate=parse_int(stream.get('sample_rate')),
+        channels=stream.get('channels'),
+        bit_rate=parse_int(stream.get('bit_rate')),
+    ) for stream in data.get('streams', [])]
+    return MediaInfo(
+        duration=round(float(fmt.get('duration', 0)) * 1000),
+        format_name=fmt.get('format_name'),
+        size=parse_int(fmt.get('size')),
+        bit_rate=parse_int(fmt.get('bit_rate')),
+        streams=streams,
+    )
+
+
+class ProbeIndex:
+
+    """
+    Small SQLite store of probe results and other per source data (keyframes, analysis),
+    keyed by file identity so entries are invalidated when the file changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_default_cache_dir("probe.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                                    "(kind TEXT, identity TEXT, value TEXT, PRIMARY KEY (kind, identity))")
+
+    @staticmethod
+    def get_identity(video_path, *extra):
+        return json.dumps(list(get_file_identity(video_path)) + list(extra))
+
+    def get(self, kind, video_path, *extra):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM entries WHERE kind = ? AND identity = ?",
+                                          (kind, self.get_identity(video_path, *extra))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, kind, video_path, value, *extra):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                    (kind, self.get_identity(video_path, *extra), json.dumps(value)))
+
+
+_index = None
+_index_lock = threading.Lock()
+_media_cache = dict()
+
+
+def get_probe_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ProbeIndex()
+        return _index
+
+
+def probe(video_path):
+    cmd = '{ffprobe} -v error -show_format -show_streams -of json "{fn}"'.format(
+        ffprobe=get_ffprobe_binary(),
+        fn=video_path,
+    )
+    succ, out = run_command(cmd)
+    if not succ:
+        raise SystemError("Could not probe {}\n{}".format(video_path, out))
+    return parse_ffprobe(out)
+
+
+def get_media_info(video_path):
+    # Memory first, then the persistent index, ffprobe only for unseen files
+    key = get_file_identity(video_path)
+    info = _media_cache.get(key)
+    if info is not None:
+        return info
+
+    data = get_probe_index().get('media', video_path)
+    if data is not None:
+        info = MediaInfo.from_dict(data)
+    else:
+        info = probe(video_path)
+        get_probe_index().put('media', video_path, info.to_dict())
+
+    _media_cache[key] = info
+    return info
+
+
+def try_get_media_info(video_path):
+    # None when the source can't be probed, e.g. ffprobe is missing
+    try:
+        return get_media_info(video_path)
+    except (OSError, SystemError):
+        return None
@@ -0,0 +1,94 @@
+from video_editor._helpers import get_ffmpeg_capabilities
+from functools import lru_cache
+import json
+import os
+import pathlib
+
+PROFILES_ENV_VAR = "VIDEO_EDITOR_PROFILES"
+
+# Each profile lists video encoder candidates by preference, the first one reported by the
+# installed ffmpeg is used. Any other key is passed to ffmpeg as an option for that stream.
+BUILTIN_PROFILES = {
+    'realtime': {
+        'video': [
+            {'encoder': 'h264_nvenc', 'preset': 'p1', 'cq': 28},
+            {'encoder': 'h264_qsv', 'preset': 'veryfast', 'global_quality': 28},
+            {'encoder': 'libx264', 'preset': 'ultrafast', 'crf': 28, 'tune': 'fastdecode'},
+        ],
+        'audio': {'encoder': 'aac', 'bitrate': '96k'},
+    },
+    'balanced': {
+        'video': [
+            {'encoder': 'libx264', 'preset': 'medium', 'crf': 23},
+            {'encoder': 'h264_nvenc', 'preset': 'p4', 'cq': 23},
+        ],
+        'audio': {'encoder': 'aac', 'bitrate': '128k'},
+    },
+    'archive': {
+        'video': [
+            {'encoder': 'libx264', 'preset': 'slow', 'crf': 18},
+            {'encoder': 'libx265', 'preset': 'slow', 'crf': 20},
+        ],
+        'audio': {'encoder': 'aac', 'bitrate': '192k'},
+    },
+}
+
+
+def get_profiles_path():
+    default = pathlib.Path.home() / ".config" / "video_editor" / "profiles.json"
+    return os.environ.get(PROFILES_ENV_VAR) or str(default)
+
+
+@lru_cache(maxsize=None)
+def get_profiles():
+    # User profiles are read once and override the built-in ones with the same name
+    profiles = dict(BUILTIN_PROFILES)
+    path = get_profiles_path()
+    if os.path.exists(path):
+        with open(path, "rt") as profiles_file:
+            profiles.update(json.load(profiles_file))
+    return profiles
+
+
+def get_config_profile(config):
+    # A profile only sets how a compressed split is encoded
+    return config.get('profile') if config.get('compress', False) else None
+
+
+def select_encoder(candidates):
+    encoders = get_ffmpeg_capabilities()['encoders']
+    for candidate in candidates:
+        if candidate['encoder'] in encoders:
+            return candidate
+    # Capabilities may be unknown (e.g. listing failed), the software encoder is the safest bet
+    for candidate in candidates:
+        if candidate['encoder'] == 'libx264':
+            return candidate
+    return candidates[-1]
+
+
+def get_stream_args(settings, stream):
+    args = ["-c:{} {}".format(stream, settings['encoder'])]
+    for key, value in settings.items():
+        if key == 'encoder':
+            continue
+        if key == 'threads':
+            args.append("-threads {}".format(value))
+        elif key == 'bitrate':
+            args.append("-b:{} {}".format(stream, value))
+        else:
+            args.append("-{}:{} {}".format(key, stream, value))
+    return args
+
+
+def get_profile_args(name):
+    profiles = get_profiles()
+    if name not in profiles:
+        raise ValueError("Unknown encoder profile '{}'".format(name))
+
+    profile = profiles[name]
+    video = profile['video'] if isinstance(profile['video'], list) else [profile['video']]
+    args = get_stream_args(select_encoder(video), 'v')
+    if profile.get('audio'):
+        args.extend(get_stream_args(profile['audio'], 'a'))
+    return args
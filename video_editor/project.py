@@ -0,0 +1,102 @@
+from video_editor.editor import VideoEditor
+from video_editor.keyframes import get_keyframe_index
+from video_editor.probe import get_media_info
+import hashlib
+import json
+import os
+import threading
+
+PROJECT_VERSION = 1
+PROJECT_EXTENSION = ".vproj"
+
+# Only the head and tail of the source are hashed, enough to recognize a file quickly
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_content_hash(path):
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode('utf8'))
+    with open(path, "rb") as source_file:
+        digest.update(source_file.read(HASH_CHUNK_SIZE))
+        if size > HASH_CHUNK_SIZE:
+            source_file.seek(max(HASH_CHUNK_SIZE, size - HASH_CHUNK_SIZE))
+            digest.update(source_file.read(HASH_CHUNK_SIZE))
+    return digest.hexdigest()
+
+
+def project_to_dict(editor, selected=None, project_dir="."):
+    source = os.path.abspath(editor.video_path)
+    return {
+        'version': PROJECT_VERSION,
+        'source': {
+            'path': source.replace("\\", "/"),
+            'relative_path': os.path.relpath(source, project_dir).replace("\\", "/"),
+            'hash': get_content_hash(source),
+        },
+        'duration': editor.video_length,
+        'splits': [{'start': split.start_time, 'end': split.end_time, 'config': split.config}
+                   for split in editor.get_splits()],
+        'selected': list(range(len(editor.get_splits()))) if selected is None else list(selected),
+    }
+
+
+def project_from_dict(data, project_dir=".", verify=True):
+    if data.get('version', 0) > PROJECT_VERSION:
+        raise ValueError("Project version {} is not supported".format(data['version']))
+
+    video_path = resolve_source(project_dir, data['source'])
+    if verify and not check_source(video_path, data['source']):
+        raise ValueError("Source video {} changed since the project was saved".format(video_path))
+    splits = [(split['start'], split['end'], split['config']) for split in data['splits']]
+    editor = VideoEditor.from_splits(video_path, data['duration'], splits)
+    return editor, data.get('selected', list(range(len(splits))))
+
+
+def save_project(path, editor, selected=None):
+    data = project_to_dict(editor, selected, os.path.dirname(os.path.abspath(path)))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wt") as project_file:
+        json.dump(data, project_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def resolve_source(project_dir, source):
+    # The absolute path first, then relative to the project in case both were moved together
+    candidates = [source['path'], os.path.join(project_dir, source['relative_path'])]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate.replace("\\", "/")
+    raise FileNotFoundError("Source video not found: {}".format(source['path']))
+
+
+def load_project(path, verify=True):
+    """
+    Restores the editor right away from the project file, nothing is probed or decoded,
+    only the head and tail of the source are hashed. Raises ValueError when the source
+    changed since the project was saved, unless verify is False.
+    Returns the editor and the selected split ids.
+    """
+    with open(path, "rt") as project_file:
+        return project_from_dict(json.load(project_file), os.path.dirname(os.path.abspath(path)), verify)
+
+
+def check_source(video_path, source):
+    # Whether the source still has the content the project was saved with
+    return get_content_hash(video_path) == source['hash']
+
+
+def bind_project(editor, callback=None):
+    # Warms probe data and keyframes in the background, callback receives any error
+    def bind():
+        error = None
+        try:
+            get_media_info(editor.video_path)
+            get_keyframe_index(editor.video_path)
+        except (OSError, SystemError) as e:
+            error = e
+        if callback is not None:
+            callback(error)
+
+    thread = threading.Thread(target=bind, daemon=True)
+    thread.start()
+    return thread
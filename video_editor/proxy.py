@@ -0,0 +1,102 @@
+from video_editor._helpers import get_ffmpeg_binary, get_file_identity, run_command
+from video_editor.cache import evict_lru, get_default_cache_dir
+from video_editor.probe import get_media_info
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+PROXY_HEIGHT = 540
+DEFAULT_PROXY_CACHE_SIZE = 20 * 1024 ** 3
+
+
+class Proxy:
+
+    """
+    Low resolution copy of a source. Both share the timeline, times are mapped through
+    the durations to absorb the few milliseconds a transcode can add or drop.
+    """
+
+    def __init__(self, source_path, proxy_path):
+        self.source_path = source_path
+        self.path = proxy_path
+        self.source_duration = get_media_info(source_path).duration
+        self.duration = get_media_info(proxy_path).duration
+
+    def to_source_time(self, time):
+        if not self.duration:
+            return time
+        return min(self.source_duration, round(time * self.source_duration / self.duration))
+
+    def to_proxy_time(self, time):
+        if not self.source_duration:
+            return time
+        return min(self.duration, round(time * self.duration / self.source_duration))
+
+
+class ProxyManager:
+
+    def __init__(self, directory=None, max_size=DEFAULT_PROXY_CACHE_SIZE):
+        self.directory = directory or get_default_cache_dir("proxies")
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_proxy_path(self, video_path):
+        key = hashlib.sha1(json.dumps(get_file_identity(video_path)).encode('utf8')).hexdigest()
+        return "{}/{}.mp4".format(self.directory, key)
+
+    def get(self, video_path):
+        proxy_path = self.get_proxy_path(video_path)
+        try:
+            os.utime(proxy_path)
+        except FileNotFoundError:
+            return None
+        return Proxy(video_path, proxy_path)
+
+    def get_command(self, video_path, output_path):
+        # All intra frames, seeking anywhere decodes a single frame
+        return '{ffmpeg} -y -i "{fn}" -map 0:v:0 -map 0:a? -vf scale=-2:{h} -c:v libx264 -preset ultrafast ' \
+               '-tune fastdecode -g 1 -crf 28 -pix_fmt yuv420p -c:a aac -b:a 96k "{o}"'.format(
+                    ffmpeg=get_ffmpeg_binary(),
+                    fn=video_path,
+                    h=PROXY_HEIGHT,
+                    o=output_path,
+                )
+
+    def generate(self, video_path, progress=None, cancel=None):
+        proxy = self.get(video_path)
+        if proxy is not None:
+            return True, proxy
+
+        proxy_path = self.get_proxy_path(video_path)
+        # Hidden from eviction until complete, and unique since the same source may be generated twice
+        tmp_path = "{}/.{}.{}".format(self.directory, uuid.uuid4().hex, os.path.basename(proxy_path))
+        succ, msg = run_command(self.get_command(video_path, tmp_path), progress=progress, cancel=cancel)
+        try:
+            if succ:
+                os.replace(tmp_path, proxy_path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except OSError as e:
+            return False, str(e)
+        if not succ:
+            return False, msg
+
+        with self.lock:
+            evict_lru(self.directory, self.max_size, keep=(proxy_path, ))
+        return True, Proxy(video_path, proxy_path)
+
+    def start(self, video_path, callback, progress=None, cancel=None):
+        # Generates the proxy in the background, callback receives generate's result
+        def generate():
+            try:
+                result = self.generate(video_path, progress, cancel)
+            except (OSError, SystemError) as e:
+                result = False, str(e)
+            callback(*result)
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,225 @@
+from video_editor.cache import RenderCache, get_default_cache_dir
+from video_editor.project import project_from_dict, project_to_dict
+from functools import partial
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Seconds between progress writes of a running job
+PROGRESS_INTERVAL = 1.0
+
+# Store of the GUI jobs, kept apart from the command line queue so each only runs its own
+GUI_STORE = "gui_queue.sqlite"
+
+
+def is_process_alive(pid):
+    # os.kill would terminate the process on Windows, jobs are assumed orphaned there
+    if not pid or os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+class JobStore:
+
+    """
+    Jobs persisted in SQLite, so they survive restarts and can be shared by several
+    processes (e.g. `queue submit` and `queue run`).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_default_cache_dir("queue.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                    "priority INTEGER, status TEXT, output TEXT, payload TEXT, progress REAL, "
+                                    "message TEXT, owner INTEGER, created REAL, updated REAL)")
+
+    def execute(self, query, parameters=()):
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    def add(self, payload, output, priority=0):
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (priority, status, output, payload, progress, message, created, updated) "
+                "VALUES (?, ?, ?, ?, 0, '', ?, ?)", (priority, PENDING, output, json.dumps(payload), now, now))
+            return cursor.lastrowid
+
+    def claim(self):
+        # Takes the next pending job atomically, even across processes
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute("SELECT id, payload, output FROM jobs WHERE status = ? "
+                                              "ORDER BY priority DESC, id LIMIT 1", (PENDING, )).fetchone()
+                if row is not None:
+                    self.connection.execute("UPDATE jobs SET status = ?, owner = ?, updated = ? WHERE id = ?",
+                                            (RUNNING, os.getpid(), time.time(), row[0]))
+            finally:
+                self.connection.execute("COMMIT")
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ", ".join("{} = ?".format(column) for column in fields)
+        self.execute("UPDATE jobs SET {} WHERE id = ?".format(columns), list(fields.values()) + [job_id])
+
+    def get_status(self, job_id):
+        rows = self.execute("SELECT status FROM jobs WHERE id = ?", (job_id, ))
+        return rows[0][0] if rows else None
+
+    def list(self, statuses=None):
+        query = "SELECT id, priority, status, output, progress, message FROM jobs"
+        parameters = []
+        if statuses:
+            query += " WHERE status IN ({})".format(", ".join("?" * len(statuses)))
+            parameters = list(statuses)
+        columns = ('id', 'priority', 'status', 'output', 'progress', 'message')
+        return [dict(zip(columns, row)) for row in self.execute(query + " ORDER BY id", parameters)]
+
+    def requeue_interrupted(self):
+        # Jobs left running by a process that died are started again
+        for job_id, owner in self.execute("SELECT id, owner FROM jobs WHERE status = ?", (RUNNING, )):
+            if owner == os.getpid() or not is_process_alive(owner):
+                self.update(job_id, status=PENDING, progress=0)
+
+
+class RenderQueue:
+
+    """
+    Runs export jobs from the job store with a limited number of concurrent exports.
+    Each job holds a snapshot of the project, so editing can go on after submitting.
+    Rendered splits go through the render cache, a resumed job only renders what's missing.
+    """
+
+    def __init__(self, store=None, concurrency=1, render_cache=None):
+        self.store = store or JobStore()
+        self.concurrency = concurrency
+        self.render_cache = render_cache
+        self.stopping = threading.Event()
+        self.cancel_events = dict()
+        # Progress of the splits each running job is exporting, by (start_time, end_time)
+        self.split_progress = dict()
+        self.workers = []
+
+    def submit(self, editor, split_ids, output, priority=0):
+        payload = {'project': project_to_dict(editor, split_ids), 'split_ids': list(split_ids),
+                   'join': True, 'export_mode': editor.export_mode, 'join_engine': editor.join_engine}
+        return self.store.add(payload, output, priority)
+
+    def submit_split(self, editor, split_id, output, priority=0):
+        payload = {'project': project_to_dict(editor, [split_id]), 'split_ids': [split_id],
+                   'join': False, 'export_mode': editor.export_mode}
+        return self.store.add(payload, output, priority)
+
+    def cancel(self, job_id):
+        # Running jobs notice the status change, also when they run in another process
+        if self.store.get_status(job_id) in (PENDING, RUNNING):
+            self.store.update(job_id, status=CANCELLED, message="Cancelled")
+        if job_id in self.cancel_events:
+            self.cancel_events[job_id].set()
+
+    def get_split_progress(self, job_id):
+        # Splits are identified by their bounds, they still match after the project is edited
+        return dict(self.split_progress.get(job_id, ()))
+
+    def watch_cancel(self, job_id, cancel, finished):
+        while not finished.wait(PROGRESS_INTERVAL):
+            if self.store.get_status(job_id) == CANCELLED:
+                cancel.set()
+                return
+
+    def run_job(self, job_id, payload, output):
+        cancel = threading.Event()
+        finished = threading.Event()
+        self.cancel_events[job_id] = cancel
+        threading.Thread(target=self.watch_cancel, args=(job_id, cancel, finished), daemon=True).start()
+        last_update = [0]
+        splits_progress = self.split_progress[job_id] = dict()
+
+        def progress(finished, total):
+            if time.time() - last_update[0] >= PROGRESS_INTERVAL or finished == total:
+                last_update[0] = time.time()
+                self.store.update(job_id, progress=finished / total if total else 0)
+
+        def split_progress(split_id, event):
+            # The join reports no split id
+            if split_id is None or event['out_time'] is None:
+                return
+            split = editor.splits[split_id]
+            if split.output_duration:
+                splits_progress[(split.start_time, split.end_time)] = min(
+                    1, event['out_time'] * 1000 / split.output_duration)
+
+        try:
+            editor, _ = project_from_dict(payload['project'])
+            editor.export_mode = payload.get('export_mode', editor.export_mode)
+            editor.join_engine = payload.get('join_engine', editor.join_engine)
+            editor.render_cache = self.render_cache or RenderCache()
+            if payload['join']:
+                succ, msg = editor.export_and_join_splits(payload['split_ids'], output, progress=progress,
+                                                          split_progress=split_progress, cancel=cancel)
+            else:
+                split_id = payload['split_ids'][0]
+                succ, msg = editor.export_split(split_id, output, progress=partial(split_progress, split_id),
+                                                cancel=cancel)
+        except Exception as e:
+            # Any error fails the job alone, the worker goes on with the next one
+            succ, msg = False, repr(e)
+        finally:
+            finished.set()
+            del self.cancel_events[job_id]
+            del self.split_progress[job_id]
+
+        if cancel.is_set():
+            self.store.update(job_id, status=CANCELLED, message="Cancelled")
+        elif succ:
+            self.store.update(job_id, status=DONE, progress=1, message=output)
+        else:
+            self.store.update(job_id, status=FAILED, message=msg.strip().split("\n")[-1])
+
+    def work(self, wait=True):
+        while not self.stopping.is_set():
+            job = self.store.claim()
+            if job is None:
+                if not wait:
+                    return
+                self.stopping.wait(PROGRESS_INTERVAL)
+                continue
+            self.run_job(*job)
+
+    def start(self, wait=True):
+        # Workers keep polling for new jobs when wait is set, otherwise they stop once the queue is empty
+        self.store.requeue_interrupted()
+        self.stopping.clear()
+        self.workers = [threading.Thread(target=self.work, args=(wait, ), daemon=True)
+                        for _ in range(self.concurrency)]
+        for worker in self.workers:
+            worker.start()
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,197 @@
+from video_editor.probe import MediaInfo, get_media_info, try_get_media_info
+from video_editor.profiles import get_config_profile, get_profiles
+from video_editor.scheduler import get_default_workers
+from collections import namedtuple
+import os
+import shutil
+import tempfile
+
+# Extra temporary folders to choose from, separated like PATH entries
+TMP_DIRS_ENV_VAR = "VIDEO_EDITOR_TMP_DIRS"
+
+# Estimates are padded, encoders overshoot their average bit rate on short splits
+SIZE_MARGIN = 1.25
+
+# Used when probing gives neither a bit rate nor a size
+BITS_PER_PIXEL = 0.1
+DEFAULT_BIT_RATE = 8 * 1000 ** 2
+
+# Share of the source video bit rate kept by compressed splits, crf encodes have no fixed rate
+COMPRESS_RATIO = 0.6
+
+# Rough memory use of an ffmpeg job: the process itself plus the frames held by the decoder,
+# filters and the encoder lookahead
+PROCESS_MEMORY = 150 * 1024 ** 2
+FRAME_BUFFERS = 60
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+# Stands for a source that can't be probed, estimates then use the defaults above
+UNKNOWN_MEDIA = MediaInfo(None, None, None, None, [])
+
+ExportPlan = namedtuple('ExportPlan', ['temp_dir', 'workers', 'temp_size', 'output_size', 'memory_per_job'])
+
+
+def parse_size(size):
+    # "500M", "20G" or a number of bytes
+    size = str(size).strip().upper().rstrip("B")
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(float(size))
+
+
+def format_size(size):
+    for unit in ('T', 'G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit]:
+            return "{:.1f}{}B".format(size / SIZE_UNITS[unit], unit)
+    return "{}B".format(size)
+
+
+def get_free_space(path):
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def get_temp_candidates():
+    dirs = [path for path in os.environ.get(TMP_DIRS_ENV_VAR, "").split(os.pathsep) if path]
+    return dirs + [tempfile.gettempdir()]
+
+
+def choose_temp_dir():
+    # Returns the candidate folder with the most free space and that space
+    best = max(get_temp_candidates(), key=get_free_space)
+    return best, get_free_space(best)
+
+
+def temp_directory():
+    # A TemporaryDirectory in the folder with the most free space
+    return tempfile.TemporaryDirectory(dir=choose_temp_dir()[0])
+
+
+def is_same_device(path, other_path):
+    try:
+        return os.stat(path).st_dev == os.stat(other_path).st_dev
+    except OSError:
+        return False
+
+
+def get_bit_rate(info):
+    if info.bit_rate:
+        return info.bit_rate
+    if info.size and info.duration:
+        return info.size * 8 * 1000 / info.duration
+    stream = info.video_stream
+    if stream is not None and stream.width and stream.height:
+        return stream.width * stream.height * (stream.frame_rate or 30) * BITS_PER_PIXEL
+    return DEFAULT_BIT_RATE
+
+
+def parse_bit_rate(bit_rate):
+    # ffmpeg style rates, e.g. "128k" or "4M"
+    bit_rate = str(bit_rate).strip().lower()
+    units = {'k': 1000, 'm': 1000 ** 2}
+    if bit_rate and bit_rate[-1] in units:
+        return int(float(bit_rate[:-1]) * units[bit_rate[-1]])
+    return int(float(bit_rate))
+
+
+def get_profile_bit_rates(name):
+    # (video, audio) bit rates set by an encoder profile, None where it uses a quality target
+    profile = get_profiles().get(name, dict())
+    video = profile.get('video') or dict()
+    video = video[0] if isinstance(video, list) else video
+    audio = profile.get('audio') or dict()
+    return tuple(parse_bit_rate(settings['bitrate']) if settings.get('bitrate') else None
+                 for settings in (video, audio))
+
+
+def estimate_split_size(split, info=None):
+    """
+    Output size of a reencoded split from the source bit rates and its config: compressing
+    lowers the video rate, profiles may set the rates, and silenced audio is about free.
+    Speed changes are in the output duration.
+    """
+    info = info or get_media_info(split.video_path)
+    audio = sum(stream.bit_rate or 0 for stream in info.get_streams('audio'))
+    video = max(0, get_bit_rate(info) - audio)
+
+    config = split.config
+    profile = get_config_profile(config)
+    if config.get('compress'):
+        video *= COMPRESS_RATIO
+    if profile:
+        profile_video, profile_audio = get_profile_bit_rates(profile)
+        video = profile_video or video
+        audio = profile_audio if profile_audio and info.has_audio else audio
+    if config.get('removeaudio'):
+        audio = 0
+    return int((video + audio) / 8 * split.output_duration / 1000 * SIZE_MARGIN)
+
+
+def estimate_intermediate_size(split, mode, info=None):
+    # Temporary space used while exporting a split, besides its output
+    if mode == 'chained':
+        # A stage's input is deleted once it's done, at most two intermediates exist at once
+        return 2 * estimate_split_size(split, info)
+    if mode == 'smart':
+        # Segments are joined into the output
+        return estimate_split_size(split, info)
+    return 0
+
+
+def estimate_job_memory(info):
+    stream = info.video_stream
+    if stream is None or not stream.width or not stream.height:
+        return PROCESS_MEMORY
+    return PROCESS_MEMORY + int(stream.width * stream.height * 1.5 * FRAME_BUFFERS)
+
+
+class ResourcePlanner:
+
+    """
+    Checks an export fits in the disk before it starts, and limits its concurrency so the
+    temporary files and ffmpeg processes stay within the budgets (bytes, None to only use
+    the free space and no memory limit).
+    """
+
+    def __init__(self, disk_budget=None, memory_budget=None):
+        self.disk_budget = disk_budget
+        self.memory_budget = memory_budget
+
+    def plan(self, splits, mode, output_file, workers=None, cached=False):
+        """
+        Returns (True, ExportPlan) or (False, message). Rendered splits stay in the temp
+        folder until they're joined, unless they go to the render cache.
+        """
+        if not splits:
+            return True, ExportPlan(choose_temp_dir()[0], workers or get_default_workers(), 0, 0, PROCESS_MEMORY)
+
+        info = try_get_media_info(splits[0].video_path) or UNKNOWN_MEDIA
+        sizes = [estimate_split_size(split, info) for split in splits]
+        transient = max(estimate_intermediate_size(split, mode, info) for split in splits)
+        kept = 0 if cached else sum(sizes)
+        output_size = sum(sizes)
+
+        temp_dir, free = choose_temp_dir()
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        if is_same_device(temp_dir, output_dir):
+            free -= output_size
+        elif get_free_space(output_dir) < output_size:
+            return False, "The output needs about {}, only {} free in {}".format(
+                format_size(output_size), format_size(get_free_space(output_dir)), output_dir)
+
+        available = free if self.disk_budget is None else min(free, self.disk_budget)
+        if available < kept + transient:
+            return False, "The export needs about {} of temporary space, only {} available".format(
+                format_size(kept + transient), format_size(max(0, available)))
+
+        workers = workers or get_default_workers()
+        if transient:
+            workers = min(workers, max(1, (available - kept) // transient))
+        memory_per_job = estimate_job_memory(info)
+        if self.memory_budget is not None:
+            workers = min(workers, max(1, self.memory_budget // memory_per_job))
+
+        return True, ExportPlan(temp_dir, workers, kept + transient * workers, output_size, memory_per_job)
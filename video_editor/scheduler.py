@@ -0,0 +1,91 @@
+from video_editor._helpers import CANCEL_POLL_INTERVAL
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import os
+import threading
+import time
+
+
+def get_default_workers():
+    # Encoders are multithreaded themselves, a few concurrent jobs are enough to fill the box
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+class CancelScope:
+
+    """
+    Cancel event of a single export, also set while the caller's event is. Setting it
+    leaves the caller's event alone, so a failed export doesn't cancel the next ones.
+    """
+
+    def __init__(self, parent=None):
+        self.event = threading.Event()
+        self.parent = parent
+
+    def set(self):
+        self.event.set()
+
+    def is_set(self):
+        return self.event.is_set() or (self.parent is not None and self.parent.is_set())
+
+    def wait(self, timeout=None):
+        # The parent is checked at least every CANCEL_POLL_INTERVAL
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            interval = CANCEL_POLL_INTERVAL if deadline is None else \
+                min(CANCEL_POLL_INTERVAL, deadline - time.monotonic())
+            if interval <= 0:
+                return False
+            self.event.wait(interval)
+        return True
+
+
+class ExportScheduler:
+
+    """
+    Runs independent export jobs concurrently. Each job is a callable receiving the
+    ffmpeg thread budget and a cancel event, and returning a (success, message) tuple
+    like actions do.
+    """
+
+    def __init__(self, workers=None, threads_per_job=None, progress=None, cancel=None):
+        self.workers = workers or get_default_workers()
+        self.threads_per_job = threads_per_job or max(1, (os.cpu_count() or 1) // self.workers)
+        self.progress = progress
+        self.cancel = CancelScope(cancel)
+
+    def report(self, finished, total):
+        if self.progress is not None:
+            self.progress(finished, total)
+
+    def run(self, jobs):
+        results = [None] * len(jobs)
+        if not jobs:
+            return True, results
+
+        finished = 0
+        self.report(finished, len(jobs))
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+            futures = {pool.submit(job, threads=self.threads_per_job, cancel=self.cancel): i
+                       for i, job in enumerate(jobs)}
+            pending = set(futures)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        succ, msg = future.result()
+                    except Exception as e:
+                        succ, msg = False, repr(e)
+                    if not succ:
+                        # Drop queued jobs and kill the running ones
+                        for other in pending:
+                            other.cancel()
+                        self.cancel.set()
+                        return False, msg
+
+                    results[futures[future]] = msg
+                    finished += 1
+                    self.report(finished, len(jobs))
+
+        return True, results
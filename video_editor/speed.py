@@ -0,0 +1,181 @@
+from bisect import bisect_right
+from math import log1p
+
+try:
+    import numpy
+except ImportError:
+    # Remapping falls back to plain Python, only slower on long timestamp lists
+    numpy = None
+
+# Length (ms) of the constant tempo audio pieces approximating a ramp
+AUDIO_STEP = 250
+
+# atempo only accepts factors in this range on older ffmpeg versions
+ATEMPO_MIN = 0.5
+ATEMPO_MAX = 2.0
+
+
+def get_atempo_filters(factor):
+    # Chains 2.0 or 0.5 stages until the remaining factor is in range
+    filters = []
+    while factor > ATEMPO_MAX:
+        filters.append("atempo={}".format(ATEMPO_MAX))
+        factor /= ATEMPO_MAX
+    while factor < ATEMPO_MIN:
+        filters.append("atempo={}".format(ATEMPO_MIN))
+        factor /= ATEMPO_MIN
+    if round(factor, 4) != 1 or not filters:
+        filters.append("atempo={}".format(round(factor, 4)))
+    return filters
+
+
+class SpeedCurve:
+
+    """
+    Piecewise linear speed of a split, as (time, speed) points with the time (ms) relative
+    to the split start. Speed ramps linearly between points and stays constant before the
+    first and after the last one. A constant factor is a curve with a single point.
+
+    Example config
+    'speedup': {
+      'curve': [[0, 1], [2000, 4], [5000, 4], [6000, 1]],
+    }
+    """
+
+    def __init__(self, points, duration=None):
+        # duration (ms) of the split, when known no point may come after its end
+        points = sorted((float(time), float(speed)) for time, speed in points)
+        if not points or any(speed <= 0 for _, speed in points):
+            raise ValueError("Speed curve needs at least one point and positive speeds")
+        if any(time >= next_time for (time, _), (next_time, _) in zip(points, points[1:])):
+            raise ValueError("Speed curve point times must be strictly increasing")
+        if points[0][0] < 0 or (duration is not None and points[-1][0] > duration):
+            raise ValueError("Speed curve point times must be within the split")
+        if points[0][0] > 0:
+            points.insert(0, (0.0, points[0][1]))
+        self.times = [time for time, _ in points]
+        self.speeds = [speed for _, speed in points]
+
+        # Output time at every point, the integral of 1 / speed
+        self.outputs = [0.0]
+        for i in range(len(points) - 1):
+            self.outputs.append(self.outputs[-1] + self.get_piece_output(i, self.times[i + 1]))
+
+    @classmethod
+    def from_config(cls, config, duration=None):
+        # None when the config doesn't change the speed
+        speedup = config.get('speedup', False)
+        if not speedup or not isinstance(speedup, dict):
+            return None
+        if speedup.get('curve'):
+            return cls(speedup['curve'], duration)
+        factor = speedup.get('factor', 1)
+        if not factor or factor == 1:
+            return None
+        return cls([(0, factor)])
+
+    @property
+    def is_constant(self):
+        return len(set(self.speeds)) == 1
+
+    def get_slope(self, i):
+        if i + 1 >= len(self.times):
+            return 0
+        return (self.speeds[i + 1] - self.speeds[i]) / (self.times[i + 1] - self.times[i])
+
+    def get_piece_output(self, i, time):
+        # Output time elapsed from point i to time, inside piece i
+        slope = self.get_slope(i)
+        elapsed = time - self.times[i]
+        if not slope:
+            return elapsed / self.speeds[i]
+        return log1p(slope * elapsed / self.speeds[i]) / slope
+
+    def remap(self, times):
+        # Output times of a list of source times (ms), computed in a single batch
+        if numpy is not None:
+            return self.remap_numpy(numpy.asarray(times, dtype=float)).tolist()
+        result = []
+        for time in times:
+            i = max(0, bisect_right(self.times, time) - 1)
+            result.append(self.outputs[i] + self.get_piece_output(i, time))
+        return result
+
+    def remap_numpy(self, times):
+        point_times = numpy.asarray(self.times)
+        speeds = numpy.asarray(self.speeds)
+        slopes = numpy.asarray([self.get_slope(i) for i in range(len(self.times))])
+        indexes = numpy.clip(numpy.searchsorted(point_times, times, side='right') - 1, 0, None)
+
+        elapsed = times - point_times[indexes]
+        slope, speed = slopes[indexes], speeds[indexes]
+        ramped = slope != 0
+        safe_slope = numpy.where(ramped, slope, 1)
+        pieces = numpy.where(ramped, numpy.log1p(safe_slope * elapsed / speed) / safe_slope, elapsed / speed)
+        return numpy.asarray(self.outputs)[indexes] + pieces
+
+    def output_duration(self, duration):
+        return self.remap([duration])[0]
+
+    def get_video_filter(self):
+        if self.is_constant:
+            return "setpts=PTS/{}".format(self.speeds[0])
+
+        # Nested if() over the pieces, T and the result are in seconds
+        expression = self.get_piece_expression(len(self.times) - 1)
+        for i in reversed(range(len(self.times) - 1)):
+            expression = "if(lt(T,{:.6f}),{},{})".format(self.times[i + 1] / 1000, self.get_piece_expression(i),
+                                                        expression)
+        return "setpts='({})/TB'".format(expression)
+
+    def get_piece_expression(self, i):
+        start, output = self.times[i] / 1000, self.outputs[i] / 1000
+        slope = self.get_slope(i) * 1000
+        if not slope:
+            return "{:.6f}+(T-{:.6f})/{:.6f}".format(output, start, self.speeds[i])
+        return "{:.6f}+log(1+({:.6f})*(T-{:.6f}))/({:.6f})".format(output, slope / self.speeds[i], start, slope)
+
+    def get_audio_pieces(self):
+        # (start, end, tempo) pieces of constant tempo, the last one is open ended
+        boundaries = []
+        for i in range(len(self.times) - 1):
+            steps = max(1, round((self.times[i + 1] - self.times[i]) / AUDIO_STEP)) if self.get_slope(i) else 1
+            step = (self.times[i + 1] - self.times[i]) / steps
+            boundaries.extend(self.times[i] + j * step for j in range(steps))
+        boundaries.append(self.times[-1])
+
+        outputs = self.remap(boundaries)
+        pieces = []
+        for i in range(len(boundaries) - 1):
+            tempo = (boundaries[i + 1] - boundaries[i]) / (outputs[i + 1] - outputs[i])
+            if pieces and abs(pieces[-1][2] - tempo) < 1e-6:
+                pieces[-1] = (pieces[-1][0], boundaries[i + 1], tempo)
+            else:
+                pieces.append((boundaries[i], boundaries[i + 1], tempo))
+        if pieces and abs(pieces[-1][2] - self.speeds[-1]) < 1e-6:
+            pieces[-1] = (pieces[-1][0], None, self.speeds[-1])
+        else:
+            pieces.append((boundaries[-1], None, self.speeds[-1]))
+        return pieces
+
+    def get_audio_filter(self, label="sp"):
+        """
+        A single filter chain for the audio, the pieces of a ramp are trimmed, stretched
+        and joined back inside it. label prefixes the inner pad names, it has to be unique
+        in the filter graph.
+        """
+        pieces = self.get_audio_pieces()
+        if len(pieces) == 1:
+            return ",".join(get_atempo_filters(pieces[0][2]))
+
+        count = len(pieces)
+        graph = ["asplit={}{}".format(count, "".join("[{}i{}]".format(label, i) for i in range(count)))]
+        for i, (start, end, tempo) in enumerate(pieces):
+            trim = "start={:.3f}".format(start / 1000)
+            if end is not None:
+                trim += ":end={:.3f}".format(end / 1000)
+            graph.append("[{l}i{i}]atrim={t},asetpts=PTS-STARTPTS,{a}[{l}o{i}]".format(
+                l=label, i=i, t=trim, a=",".join(get_atempo_filters(tempo))))
+        graph.append("{}concat=n={}:v=0:a=1".format("".join("[{}o{}]".format(label, i) for i in range(count)),
+                                                   count))
+        return ";".join(graph)
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import json
+import os
+import threading
+import time
+
+_sinks = []
+# A context variable instead of a thread local, so asyncio tasks sharing a thread keep their own fields
+_context = ContextVar('trace_context', default=dict())
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def get_context():
+    return dict(_context.get())
+
+
+@contextmanager
+def context(**fields):
+    # Fields (e.g. split_id) attached to every event recorded in this thread or task
+    token = _context.set(dict(_context.get(), **fields))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def bind(func, **fields):
+    # Wraps a job so its events carry the fields in whichever thread it runs
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with context(**fields):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def get_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+@contextmanager
+def span(stage, command=None, input_path=None, output_path=None):
+    """
+    Records a stage of an export. The yielded dict can be filled with extra fields,
+    run_command adds the cpu time and peak memory of the process to it.
+    """
+    event = dict(get_context(), stage=stage, command=command)
+    if not _sinks:
+        yield event
+        return
+
+    event['input_size'] = get_size(input_path)
+    event['thread'] = threading.get_ident()
+    event['start'] = time.time()
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event['wall_time'] = time.perf_counter() - start
+        event['output_size'] = get_size(output_path)
+        for sink in list(_sinks):
+            sink.write(event)
+
+
+class JsonLinesSink:
+
+    def __init__(self, path):
+        self.file = open(path, "at")
+        self.lock = threading.Lock()
+
+    def write(self, event):
+        with self.lock:
+            self.file.write(json.dumps(event) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ChromeTraceSink:
+
+    """
+    Collects events in the Chrome trace event format, the file written on close can be
+    loaded in chrome://tracing or Perfetto.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self.lock = threading.Lock()
+
+    def write(self, event):
+        args = {key: value for key, value in event.items() if key not in ('stage', 'start', 'wall_time', 'thread')}
+        name = event['stage']
+        if event.get('split_id') is not None:
+            name = "{} #{}".format(name, event['split_id'])
+        with self.lock:
+            self.events.append({
+                'name': name,
+                'cat': event['stage'],
+                'ph': 'X',
+                'ts': int(event['start'] * 1e6),
+                'dur': int(event['wall_time'] * 1e6),
+                'pid': os.getpid(),
+                'tid': event['thread'],
+                'args': args,
+            })
+
+    def close(self):
+        with self.lock, open(self.path, "wt") as trace_file:
+            json.dump({'traceEvents': self.events}, trace_file)
+
+
+def open_sink(path):
+    return ChromeTraceSink(path) if path.endswith(".json") else JsonLinesSink(path)
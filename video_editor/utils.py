@@ -1,10 +1,28 @@
 from video_editor._helpers import run_command, get_ffmpeg_binary
+from video_editor.aio import run_command_async
+from video_editor import trace
 
 
-def join_video_list(list_file, output_file):
-    cmd = '{ffmpeg} -y -safe 0 -f concat -i "{list_file}" "{o}"'.format(
+def get_join_command(list_file, output_file, copy=False):
+    return '{ffmpeg} -y -safe 0 -f concat -i "{list_file}" {c} "{o}"'.format(
         ffmpeg=get_ffmpeg_binary(),
         list_file=list_file,
+        c="-c copy" if copy else "",
         o=output_file
     )
-    return run_command(cmd)
+
+
+def join_video_list(list_file, output_file, copy=False, progress=None, cancel=None):
+    cmd = get_join_command(list_file, output_file, copy)
+    with trace.span("JoinVideoList", cmd, list_file, output_file) as event:
+        succ, msg = run_command(cmd, progress=progress, cancel=cancel, usage=event)
+        event['success'] = succ
+    return succ, msg
+
+
+async def join_video_list_async(list_file, output_file, copy=False, progress=None, timeout=None):
+    cmd = get_join_command(list_file, output_file, copy)
+    with trace.span("JoinVideoList", cmd, list_file, output_file) as event:
+        succ, msg = await run_command_async(cmd, progress=progress, timeout=timeout, usage=event)
+        event['success'] = succ
+    return succ, msg